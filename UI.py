@@ -1,14 +1,11 @@
 import sys
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtGui import QTextCursor
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout,
                              QTextEdit, QLineEdit, QPushButton, QFileDialog, QLabel)
-from router import router_func
-from main import main
-from main import ChatEngine              #  NEW
+from main import ChatEngine, LOADING_NOTICE  # light; the models load in the background
 from bot_utils import citation_from_text # already added earlier
-from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
+from telemetry import trace
 
 # right under the imports:
 RESUME_SYSTEM_PROMPT = """
@@ -17,13 +14,124 @@ You are ASU CareerBot, a friendly, expert career coach for first-year and intern
 Always begin by asking about language preference and English experience, and explain that you do this to make communication as clear and supportive as possible. Offer to use the student’s native language if it helps them feel more comfortable or confident.
 """
 
+RESEARCH_SYSTEM_PROMPT = """
+You are WriteWise, an expert, friendly, and adaptable writing assistant. Your role is to help users with any writing task—academic, professional, creative, or technical—while providing guidance on all major citation styles (APA, MLA, Chicago, Harvard, IEEE, etc.), a wide range of writing styles (formal, informal, persuasive, narrative, technical, etc.), and detailed formatting support. Your goal is to empower users to write confidently, accurately, and in compliance with their specific requirements.
 
 
+Next Steps: Gather Writing Task Details
+After confirming the language, proceed to ask:
+
+The type of writing task (e.g., essay, report, email, creative story)
+
+The required citation style (APA, MLA, Chicago, Harvard, IEEE, or other)
+
+The preferred writing style (formal, informal, technical, creative, etc.)
+
+Any specific formatting needs (e.g., headings, bullet points, tables, line spacing, font)
+
+The user’s familiarity with academic writing, citations, and formatting
+
+If the user is unsure about citation or formatting requirements, offer brief, clear explanations of the major options and help them choose what fits their context.
+
+Personalization & Support
+Adapt your tone and explanations to the user’s experience level. Use simple language and step-by-step instructions for beginners; use advanced terminology and concise guidance for experienced writers.
+
+For every writing request:
+
+Clearly explain your approach and reasoning.
+
+Provide examples or templates relevant to the user’s field or task.
+
+Offer formatting tips, including how to structure documents, use headings, lists, tables, and insert citations.
+
+When providing citations, ensure accuracy and adherence to the requested style. Offer both in-text and reference list examples.
+
+If asked, review or edit user writing for clarity, grammar, style, and correct citation/formatting.
+
+Always be supportive, constructive, and encouraging. Celebrate progress and help users build confidence in their writing skills.
+
+Rules of Engagement
+Never guess or fabricate citation details; if information is missing, explain what’s needed and how to find it.
+
+If a user’s request goes beyond your scope (e.g., legal or medical advice), politely explain your limitations and suggest consulting a professional.
+
+Use markdown formatting in your responses when it helps clarify structure (e.g., for tables, headings, or code blocks).
+
+When in doubt, ask clarifying questions to ensure you fully understand the user’s needs before proceeding.
+
+Output Format
+Use clear headings for each section of your response.
+
+Provide step-by-step instructions and examples as needed.
+
+When comparing citation or writing styles, use markdown tables for clarity.
+
+Summarize key points at the end of each response for easy reference.
+
+Example Conversation Opening
+“Hello! Before we get started, what language would you like to use for our conversation? I can use many languages—just let me know your preference!”
+
+(After language is set:)
+
+“Great! To help you best, could you tell me a bit about your writing project? What kind of document are you working on, and do you know which citation and writing style you need? If you’re not sure, I can explain the options!”
+
+Additional Notes
+Continuously update your guidance to reflect the latest citation style editions and writing best practices.
+
+Remain approachable, patient, and proactive in offering resources, templates, and feedback.
+
+If the user requests, provide brief overviews of different citation or writing styles to help them decide.
+
+Summary:
+Always begin by asking for the user’s language preference, and switch to that language if possible. Then, gather all necessary writing and formatting details, and provide expert, personalized support for every writing and citation need.
+"""
+
+# module constants, so every turn sends the same bytes ahead of the conversation
+SYSTEM_PROMPTS = {
+    "research": RESEARCH_SYSTEM_PROMPT,
+    "resume": RESUME_SYSTEM_PROMPT,
+}
+
+
+class ResponseWorker(QThread):
+    """
+    Runs one bot turn off the GUI thread and emits the reply piece by piece.
+    cancel() makes the worker close the generator at the next piece, which
+    also closes the Ollama stream.
+    """
+    token = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, make_stream, parent=None):
+        super().__init__(parent)
+        self.make_stream = make_stream
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        stream = self.make_stream()
+        try:
+            for piece in stream:
+                if self._cancelled:
+                    break
+                self.token.emit(piece)
+        except Exception as e:
+            if not self._cancelled:
+                self.failed.emit(str(e))
+        finally:
+            stream.close()
+
 
 class ChatBotWindow(QWidget):
     def __init__(self):
         super().__init__()
-        self.engine  = ChatEngine()  #  NEW
+        # returns at once; the window is usable while the models load
+        self.engine  = ChatEngine(background=True)
+        self.worker = None  # ResponseWorker of the turn in flight
+        self.workers = set()  # every worker still running, cancelled ones included
+        self.sessions = {}  # expert name -> OllamaSession
         self.initUI()
         self.chat_started = False
         self.files = []  # To keep track of added files
@@ -89,6 +197,8 @@ class ChatBotWindow(QWidget):
                 if file not in self.files:
                     self.files.append(file)
                     self.add_file_label(file)
+                    # chunked and embedded in the background; chat stays usable
+                    self.engine.add_file(file)
 
     def add_file_label(self, file_path):
         # Create a horizontal layout for each file label and remove button
@@ -115,6 +225,7 @@ class ChatBotWindow(QWidget):
         # Remove file from list
         if file_path in self.files:
             self.files.remove(file_path)
+            self.engine.remove_file(file_path)
 
         # Remove widgets from layout
         while file_layout.count():
@@ -127,165 +238,52 @@ class ChatBotWindow(QWidget):
 
     def send_message(self):
         user_message = self.input_field.text().strip()
-        if user_message:
+        if user_message and self.worker is None:
             # Display user message
             self.chat_display.append(f"<b>You:</b> {user_message}")
 
             # Clear input field
             self.input_field.clear()
 
-            # Generate and display bot response
-            # In a real application, you would call your chatbot's logic here
-            bot_response = self.get_bot_response(user_message)
-            self.chat_display.append(f"<b>Bot:</b> {bot_response}")
+            # Generate the bot response on a worker thread and stream it in
+            self.chat_display.append("<b>Bot:</b> ")
+            self.input_field.setEnabled(False)
+            worker = ResponseWorker(lambda: self.iter_bot_response(user_message), self)
+            worker.token.connect(self.append_bot_text)
+            worker.failed.connect(lambda err: self.append_bot_text(f"(error: {err})"))
+            worker.finished.connect(lambda w=worker: self.on_response_finished(w))
+            self.worker = worker
+            self.workers.add(worker)
+            worker.start()
+
+    def append_bot_text(self, text):
+        cursor = self.chat_display.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.chat_display.setTextCursor(cursor)
+        self.chat_display.ensureCursorVisible()
+
+    def on_response_finished(self, worker):
+        self.workers.discard(worker)
+        if self.worker is worker:
+            self.worker = None
+            self.input_field.setEnabled(True)
+            self.input_field.setFocus()
+        worker.deleteLater()
+
+    def cancel_response(self):
+        # stop listening right away; the thread winds down at the next token
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.token.disconnect()
+            self.worker.failed.disconnect()
+            self.worker = None
+            self.input_field.setEnabled(True)
 
     def get_bot_response(self, user_message):
-        system_prompt = ''
-        if(self.model_name == "research"):
-            system_prompt ='''
-            You are WriteWise, an expert, friendly, and adaptable writing assistant. Your role is to help users with any writing task—academic, professional, creative, or technical—while providing guidance on all major citation styles (APA, MLA, Chicago, Harvard, IEEE, etc.), a wide range of writing styles (formal, informal, persuasive, narrative, technical, etc.), and detailed formatting support. Your goal is to empower users to write confidently, accurately, and in compliance with their specific requirements.
-
-
-            Next Steps: Gather Writing Task Details
-            After confirming the language, proceed to ask:
-
-            The type of writing task (e.g., essay, report, email, creative story)
-
-            The required citation style (APA, MLA, Chicago, Harvard, IEEE, or other)
-
-            The preferred writing style (formal, informal, technical, creative, etc.)
-
-            Any specific formatting needs (e.g., headings, bullet points, tables, line spacing, font)
-
-            The user’s familiarity with academic writing, citations, and formatting
-
-            If the user is unsure about citation or formatting requirements, offer brief, clear explanations of the major options and help them choose what fits their context.
-
-            Personalization & Support
-            Adapt your tone and explanations to the user’s experience level. Use simple language and step-by-step instructions for beginners; use advanced terminology and concise guidance for experienced writers.
-
-            For every writing request:
-
-            Clearly explain your approach and reasoning.
-
-            Provide examples or templates relevant to the user’s field or task.
-
-            Offer formatting tips, including how to structure documents, use headings, lists, tables, and insert citations.
-
-            When providing citations, ensure accuracy and adherence to the requested style. Offer both in-text and reference list examples.
-
-            If asked, review or edit user writing for clarity, grammar, style, and correct citation/formatting.
-
-            Always be supportive, constructive, and encouraging. Celebrate progress and help users build confidence in their writing skills.
-
-            Rules of Engagement
-            Never guess or fabricate citation details; if information is missing, explain what’s needed and how to find it.
-
-            If a user’s request goes beyond your scope (e.g., legal or medical advice), politely explain your limitations and suggest consulting a professional.
-
-            Use markdown formatting in your responses when it helps clarify structure (e.g., for tables, headings, or code blocks).
-
-            When in doubt, ask clarifying questions to ensure you fully understand the user’s needs before proceeding.
-
-            Output Format
-            Use clear headings for each section of your response.
-
-            Provide step-by-step instructions and examples as needed.
-
-            When comparing citation or writing styles, use markdown tables for clarity.
-
-            Summarize key points at the end of each response for easy reference.
-
-            Example Conversation Opening
-            “Hello! Before we get started, what language would you like to use for our conversation? I can use many languages—just let me know your preference!”
-
-            (After language is set:)
-
-            “Great! To help you best, could you tell me a bit about your writing project? What kind of document are you working on, and do you know which citation and writing style you need? If you’re not sure, I can explain the options!”
-
-            Additional Notes
-            Continuously update your guidance to reflect the latest citation style editions and writing best practices.
-
-            Remain approachable, patient, and proactive in offering resources, templates, and feedback.
-
-            If the user requests, provide brief overviews of different citation or writing styles to help them decide.
-
-            Summary:
-            Always begin by asking for the user’s language preference, and switch to that language if possible. Then, gather all necessary writing and formatting details, and provide expert, personalized support for every writing and citation need.
-            '''
-        elif(self.model_name == "resume"):
-            system_prompt ='''
-            You are ASU CareerBot, a friendly, expert career coach for first-year and international students at Arizona State University. Your mission: help students confidently navigate every step of the U.S. job and internship search, from resumes to interviews to using ASU’s career resources. You are warm, approachable, and always sound like a real mentor—not a generic chatbot.
-
-            Language-Aware Opening: Comfort First
-            Start every conversation with this approach:
-
-            1. Language Preference & Comfort:
-            “Hi! Before we get started, I want to make sure you feel as comfortable as possible. Would you prefer to chat in your native language, or in English? I can use my language database to communicate in many languages—just let me know what works best for you!”
-
-            If the student chooses their native language, switch to that language for the conversation where possible.
-
-            If the student prefers English, or if their language isn’t supported, continue in English.
-
-            2. English Experience & Communication Style:
-            If the student chooses English, ask:
-            “Great! To make sure I explain things in a way that’s clear and helpful for you, could you tell me how long you’ve been speaking or writing in English? This helps me choose the right words and examples.”
-
-            Make it clear:
-            Explain to the student that you’re asking these questions so you can adjust how you communicate—using simpler or more complex English, or switching languages if it helps them learn and feel confident.
-
-            Continue with a Genuine, Personalized Conversation
-            After the language/comfort questions, naturally ask about:
-
-            Academic Focus & Career Interests:
-            “What are you studying at ASU? Are there any job fields or internships you’re excited about?”
-
-            Job Application Experience:
-            “Have you ever applied for jobs or internships before, either here or in your home country? What kinds of roles?”
-
-            Resume/Cover Letter Experience:
-            “Have you written a resume or cover letter in English before? If so, what was it for, and how did you feel about it?”
-
-            Familiarity with Job Search Tools:
-            “Are you familiar with platforms like LinkedIn, Handshake, or the ASU career portal?”
-
-            Biggest Job Search Challenges:
-            “Which parts of the job hunt feel most confusing or stressful for you? (Maybe writing about your experience, finding job postings, interviews, etc.?)”
-
-            Professional Vocabulary Comfort:
-            “How confident do you feel using professional or technical terms in English for your field?”
-
-            Current Job Search Stage:
-            “What stage are you at in your job search journey? (Just exploring, working on documents, applying, prepping for interviews, etc.?)”
-
-            Special Requirements or Limits:
-            “Do you have any program, professor, or visa requirements I should know about as we plan your job search?”
-
-            How You Learn Best:
-            “What’s your favorite way to learn something new? (Examples, hands-on practice, feedback, or another way?)”
-
-            Your Approach
-            Personalize everything based on the student’s answers—especially their language preference and English experience.
-
-            Adjust your communication style: Use simple or advanced English, or switch to the student’s language if possible, always explaining terms and offering relatable examples.
-
-            Break down every task into clear, manageable steps.
-
-            Share up-to-date info about ASU’s career resources, Handshake, and portfolio tools.
-
-            Provide resume and cover letter templates, examples, and feedback tailored to the student’s field, experience, and language comfort.
-
-            Coach on networking, interviewing, and U.S. workplace expectations, with special attention to international students’ needs.
-
-            Celebrate progress and encourage confidence at every step. Always be positive, empathetic, and student-centered.
-
-            Key Instruction:
-            Always begin by asking about language preference and English experience, and explain that you do this to make communication as clear and supportive as possible. Offer to use the student’s native language if it helps them feel more comfortable or confident.
-
-            Be real. Be encouraging. Be the mentor who helps every student feel seen, heard, and ready to succeed in their U.S. career journey.
-            '''
-
+        return "".join(self.iter_bot_response(user_message))
 
+    def iter_bot_response(self, user_message):
         # if user_message.lower().startswith("/cite "):
         #     parts = user_message.split(maxsplit=2)
         #     if len(parts) < 3:
@@ -293,64 +291,72 @@ class ChatBotWindow(QWidget):
         #     style, raw = parts[1], parts[2]
         #     return citation_from_text(raw, style)
         
+        if user_message.startswith("/") or user_message.lower() in ("help", "refresh"):
+            # slash commands; the ones that don't need the models work while they load
+            yield from self.engine.respond_stream(user_message)
+            return
+
+        if not self.engine.ready:
+            yield LOADING_NOTICE
+
         if self.reroute:
-            self.model_name = router_func(user_message)
+            from router import router_func
+            with trace("route"):
+                self.model_name = router_func(user_message)
             self.reroute  = False
-            return f"🔀 Rerouting to *{self.model_name}* expert…"
+            yield f"🔀 Rerouting to *{self.model_name}* expert…"
+            return
         # in_session_mem = f"{system_prompt}\n\nStudent: {user_message}\nAssistant:"
 
         # respond = self.engine.respond(in_session_mem)
         # in_session_mem += f"Student: {user_message}\nAssistant:{respond}"
-        if self.model_name == "research":
-            # build the chain exactly once, on first resume request
-            if not hasattr(self, "resume_chain"):
-                self.resume_memory = ConversationBufferMemory(
-                    memory_key="chat_history",    # must match the template below
-                    return_messages=True
-                )
-                prompt = PromptTemplate.from_template(
-                    system_prompt
-                    + "\n\n{chat_history}\n\nUser: {input}\nAssistant:"
-                )
-                self.resume_chain = LLMChain(
-                    llm    = self.engine.llm,
-                    prompt = prompt,
-                    memory = self.resume_memory
-                )
-            # then use it; it will automatically prepend the system prompt once
-            # and maintain chat_history thereafter
-            return self.resume_chain.predict(input=user_message)
-
-            # ---- RESUME PATH: pure chat, no retrieval ----
-        if self.model_name == "resume":
-            # build the chain exactly once, on first resume request
-            if not hasattr(self, "resume_chain"):
-                self.resume_memory = ConversationBufferMemory(
-                    memory_key="chat_history",    # must match the template below
-                    return_messages=True
-                )
-                prompt = PromptTemplate.from_template(
-                    RESUME_SYSTEM_PROMPT
-                    + "\n\n{chat_history}\n\nUser: {input}\nAssistant:"
-                )
-                self.resume_chain = LLMChain(
-                    llm    = self.engine.llm,
-                    prompt = prompt,
-                    memory = self.resume_memory
-                )
-            # then use it; it will automatically prepend the system prompt once
-            # and maintain chat_history thereafter
-            return self.resume_chain.predict(input=user_message)
-
-
-
+        if self.model_name in SYSTEM_PROMPTS:
+            # pure chat with the expert's system prompt, no retrieval
+            yield from self.stream_chain(user_message)
+            return
+
+    def stream_chain(self, user_message):
+        from chat_memory import TokenBudgetMemory
+        from ollama_session import OllamaSession
+
+        # one Ollama session per expert, so its system prompt stays a fixed
+        # prefix and the KV state of earlier turns is reused
+        session = self.sessions.get(self.model_name)
+        if session is None:
+            memory = TokenBudgetMemory(llm=self.engine.llm, return_messages=False)
+            session = self.sessions[self.model_name] = OllamaSession(
+                SYSTEM_PROMPTS[self.model_name], memory)
+        with trace("expert", expert=self.model_name):
+            excerpts = ""
+            if self.engine.qa.has_files():
+                # the student's own files (plus the shared index) as context for this turn
+                excerpts = "\n\n".join(
+                    f"[{d.metadata.get('source', '')}] {d.page_content}"
+                    for d in self.engine.qa.retrieve(user_message))
+            yield from session.stream(user_message, excerpts)
+
+    def closeEvent(self, event):
+        # the session ends with the window: stop generating, free the file index
+        self.hide()
+        self.cancel_response()
+        # a running QThread must not be destroyed with the window; cancelled
+        # workers may still be blocked in Ollama until its next token
+        for worker in list(self.workers):
+            worker.wait()
+        self.workers.clear()
+        self.engine.close()
+        super().closeEvent(event)
 
     def restart_chat(self):
+        # Cancel an answer that is still being generated
+        self.cancel_response()
+
         # Clear the chat display
         self.chat_display.clear()
 
         # Reset chat state
         self.chat_started = True
+        self.sessions.clear()
 
         # Display welcome message
         welcome_message = "Welcome to the chat bot! Type a message to begin."
@@ -0,0 +1,73 @@
+# answer_cache.py
+"""
+Semantic cache of RAG answers, keyed on the embedding of the standalone
+question and partitioned by language.
+
+clear() starts a new generation. An answer generated from the index before
+that (the turn read `generation` before retrieving) is not stored, so it
+can't outlive the rebuild that made it stale.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = 0.95   # cosine similarity needed for a hit
+ANSWER_CACHE_SIZE = 512         # entries per language (LRU)
+ANSWER_CACHE_TTL = 6 * 3600     # seconds
+
+
+class AnswerCache:
+    def __init__(self, embedder, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0     # bumped by clear()
+        self._langs = {}   # lang -> OrderedDict[question -> (vector, answer, stored_at)]
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str, lang: str):
+        """The stored answer for a near-duplicate question in `lang`, or None."""
+        q = self.embedder.encode_query(question)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._langs.get(lang)
+            if entries:
+                for key in [k for k, (_, _, t) in entries.items() if now - t > self.ttl]:
+                    del entries[key]
+            if not entries:
+                self.misses += 1
+                return None
+            keys = list(entries)
+            sims = np.stack([entries[k][0] for k in keys]) @ q
+            best = int(sims.argmax())
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+            entries.move_to_end(keys[best])
+            self.hits += 1
+            return entries[keys[best]][1]
+
+    def store(self, question: str, lang: str, answer: str, generation: int = None) -> None:
+        """`generation`: the value read before retrieval; stale answers are dropped."""
+        q = self.embedder.encode_query(question)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            entries = self._langs.setdefault(lang, OrderedDict())
+            entries[question] = (q, answer, time.monotonic())
+            entries.move_to_end(question)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop everything, e.g. after the index was rebuilt."""
+        with self._lock:
+            self._langs.clear()
+            self.generation += 1
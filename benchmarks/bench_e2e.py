@@ -0,0 +1,302 @@
+# benchmarks/bench_e2e.py
+"""
+End-to-end latency of the bot, fully offline (see benchmarks/offline.py).
+
+    python -m benchmarks.bench_e2e
+    python -m benchmarks.bench_e2e --json run.json
+    python -m benchmarks.bench_e2e --json new.json --compare run.json
+    python -m benchmarks.bench_e2e --first-token 0.3 --tokens-per-s 25 --net-latency 0.02
+
+Runs in a scratch working directory, so the index, page cache, Crossref
+cache and traces start out empty: the first setup_rag() is a cold start
+(model load, scrape, embed, build) and the ones after it are warm (index on
+disk, model resident). Then rebuild_vectorstore() incremental and full,
+router_func throughput, retrieval latency per mode, and ChatEngine.respond()
+per command, chat turns with time to first token.
+
+Results are JSON: one entry per measurement with n and mean/p50/p90/p99 in
+ms (plus throughput or TTFT where it applies), the per-stage totals that
+telemetry collected over the run, and the settings and commit they came
+from. --compare prints the p50 change against an earlier result file.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from time import perf_counter
+
+import numpy as np
+
+from benchmarks.offline import FakeLLM, StandIn, bench_dois, offline
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "How do I book an appointment at the writing center?",
+    "What should go in the reference list in APA style?",
+    "Can a tutor help me with my dissertation chapters?",
+    "How do I cite an image from a website?",
+    "Where is the writing center on the Tempe campus?",
+    "What is the difference between MLA and IEEE citations?",
+    "Can someone review my resume and cover letter?",
+    "How do I write a literature review for my thesis?",
+    "¿Cómo cito un artículo de revista en formato APA?",
+    "Is there help for students who write in English as a second language?",
+]
+FOLLOW_UP = "Can you give me an example of that?"
+BENCH_DOI = bench_dois(1)[0]
+UPLOAD_TEXT = (
+    "As the author argues, “the writing process is recursive rather than linear in every case” (cite).\n\n"
+    "Another view holds that “revision is where most of the real thinking happens in a paper”.\n\n"
+    "Plain paragraph without quotations.\n"
+)
+
+
+def stats(samples: list[float], **extra) -> dict:
+    a = np.asarray(samples, dtype=np.float64) * 1e3
+    out = {"n": len(a), "mean_ms": round(float(a.mean()), 3)}
+    for p in (50, 90, 99):
+        out[f"p{p}_ms"] = round(float(np.percentile(a, p)), 3)
+    out.update(extra)
+    return out
+
+
+def timed(fn, *args, **kwargs):
+    start = perf_counter()
+    result = fn(*args, **kwargs)
+    return result, perf_counter() - start
+
+
+def bench_setup(results: dict, llm, warm: int):
+    from rag_engine import SharedRag, setup_rag
+
+    _, took = timed(setup_rag, llm=llm)
+    results["setup_rag_cold"] = stats([took])
+    results["setup_rag_warm"] = stats([timed(setup_rag, llm=llm)[1] for _ in range(warm)])
+    return SharedRag(llm=llm)
+
+
+def bench_rebuild(results: dict, shared, repeat: int) -> None:
+    from rag_engine import rebuild_vectorstore
+
+    for name, full in (("rebuild_incremental", False), ("rebuild_full", True)):
+        samples = []
+        for _ in range(repeat):
+            vs, took = timed(rebuild_vectorstore, shared.embeddings, full=full, spec=shared.index_spec)
+            samples.append(took)
+            shared.swap(vs)
+        results[name] = stats(samples)
+
+
+def bench_router(results: dict, n: int) -> None:
+    from router import get_router, router_func
+
+    _, took = timed(get_router)
+    results["router_build"] = stats([took])
+    # distinct texts, so the query-embedding memo doesn't answer for the model
+    messages = [f"{QUESTIONS[i % len(QUESTIONS)]} ({i})" for i in range(n)]
+    samples = [timed(router_func, m)[1] for m in messages]
+    results["router_func"] = stats(samples, per_s=round(n / sum(samples), 1))
+    batch = [f"{m} [batch]" for m in messages]
+    _, took = timed(get_router().route_many, batch)
+    results["router_route_many"] = stats([took / n], per_s=round(n / took, 1))
+
+
+def bench_retrieval(results: dict, shared, n: int) -> None:
+    from vector_store import RETRIEVAL_MODES
+
+    store = shared.retriever.store
+    for mode in RETRIEVAL_MODES:
+        retriever = store.as_retriever(mode=mode)
+        queries = [f"{QUESTIONS[i % len(QUESTIONS)]} {mode} {i}" for i in range(n)]
+        results[f"retrieve_{mode}"] = stats([timed(retriever.invoke, q)[1] for q in queries])
+
+
+def stream_timed(engine, message: str) -> tuple[float, float]:
+    """(time to first piece, total) of one respond_stream() turn."""
+    start = perf_counter()
+    first = None
+    for _ in engine.respond_stream(message):
+        if first is None:
+            first = perf_counter()
+    end = perf_counter()
+    return (first or end) - start, end - start
+
+
+def bench_commands(results: dict, shared, repeat: int, scratch: str) -> None:
+    from main import ChatEngine
+
+    engine = ChatEngine(shared=shared)
+    upload = os.path.join(scratch, "draft.txt")
+    with open(upload, "w", encoding="utf-8") as f:
+        f.write(UPLOAD_TEXT * 20)
+    dois = iter(bench_dois(repeat * 12))
+
+    commands = {
+        "help": lambda i: "help",
+        "hours": lambda i: "/hours",
+        "map": lambda i: "/map hayden library",
+        "resources": lambda i: "/resources visa",
+        "cite": lambda i: f"/cite APA {next(dois)}",
+        "cite_cached": lambda i: f"/cite MLA {BENCH_DOI}",
+        "bib": lambda i: "/bib APA " + "\n".join(next(dois) for _ in range(10)),
+        "upload": lambda i: f"/upload {upload}",
+        "proofread": lambda i: f"/proofread {QUESTIONS[i % len(QUESTIONS)]} their is a mistake here",
+        "paraphrase": lambda i: f"/paraphrase {QUESTIONS[i % len(QUESTIONS)]}",
+        "unpack": lambda i: f"/unpack Write a 5-page argumentative essay on {QUESTIONS[i % len(QUESTIONS)]}",
+    }
+    engine.respond(f"/cite APA {BENCH_DOI}")
+    for name, make in commands.items():
+        results[f"respond_{name}"] = stats([timed(engine.respond, make(i))[1] for i in range(repeat)])
+    engine.close()
+
+    # chat turns: a new conversation each time, then a follow-up in the same one
+    first, follow, ttft, follow_ttft = [], [], [], []
+    for i in range(repeat):
+        engine = ChatEngine(shared=shared)
+        t, total = stream_timed(engine, f"{QUESTIONS[i % len(QUESTIONS)]} ({i})")
+        ttft.append(t)
+        first.append(total)
+        t, total = stream_timed(engine, FOLLOW_UP)
+        follow_ttft.append(t)
+        follow.append(total)
+        engine.close()
+    results["respond_chat"] = stats(first, ttft_p50_ms=round(float(np.median(ttft)) * 1e3, 3))
+    results["respond_chat_followup"] = stats(follow, ttft_p50_ms=round(float(np.median(follow_ttft)) * 1e3, 3))
+
+    # the same first question again: served by the answer cache
+    cached = []
+    for i in range(repeat):
+        engine = ChatEngine(shared=shared)
+        cached.append(stream_timed(engine, f"{QUESTIONS[i % len(QUESTIONS)]} ({i})")[1])
+        engine.close()
+    results["respond_chat_cached"] = stats(cached)
+
+
+def stage_totals() -> dict:
+    from telemetry import STAGE_SECONDS
+
+    return {stage: {"count": n, "total_ms": round(s * 1e3, 3), "mean_ms": round(s * 1e3 / n, 3)}
+            for stage, (n, s) in sorted(STAGE_SECONDS.totals().items()) if n}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=REPO_DIR).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run(args, scratch: str) -> dict:
+    llm = FakeLLM(args.first_token, args.tokens_per_s)
+    results = {}
+    with StandIn(latency=args.net_latency) as standin, offline(standin):
+        from chat_memory import ENCODING, tokenizer
+
+        tok = tokenizer()
+        if tok != ENCODING:
+            print(f"note: tiktoken's {ENCODING} isn't cached and can't be downloaded; token counts "
+                  "are estimated (python -m benchmarks.offline --record saves a copy)", file=sys.stderr)
+        shared = bench_setup(results, llm, args.warm)
+        bench_rebuild(results, shared, args.rebuild_repeat)
+        bench_router(results, args.router_messages)
+        bench_retrieval(results, shared, args.queries)
+        bench_commands(results, shared, args.repeat, scratch)
+        served = standin.requests
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("json", "compare", "keep")},
+            "standin_requests": served,
+            "tokenizer": tok,
+        },
+        "results": results,
+        "stages": stage_totals(),
+    }
+
+
+STAT_KEYS = ("n", "mean_ms", "p50_ms", "p90_ms", "p99_ms")
+
+
+def print_results(report: dict) -> None:
+    print(f"{'measurement':<26}{'n':>5}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}  extra")
+    for name, r in report["results"].items():
+        extra = ", ".join(f"{k}={v}" for k, v in r.items() if k not in STAT_KEYS)
+        print(f"{name:<26}{r['n']:>5}{r['p50_ms']:>11.2f}{r['p90_ms']:>11.2f}{r['p99_ms']:>11.2f}  {extra}")
+    print(f"\n{'stage':<26}{'count':>7}{'total ms':>12}{'mean ms':>11}")
+    for stage, s in report["stages"].items():
+        print(f"{stage:<26}{s['count']:>7}{s['total_ms']:>12.1f}{s['mean_ms']:>11.3f}")
+
+
+def print_comparison(base: dict, report: dict) -> None:
+    print(f"\nvs {base['meta'].get('commit') or '?'} ({base['meta'].get('timestamp', '')})")
+    print(f"{'measurement':<26}{'base p50':>11}{'p50':>11}{'change':>9}")
+    for name, r in report["results"].items():
+        old = base["results"].get(name)
+        if old is None or not old["p50_ms"]:
+            continue
+        change = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        print(f"{name:<26}{old['p50_ms']:>11.2f}{r['p50_ms']:>11.2f}{change:>+8.1f}%")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--first-token", type=float, default=0.15, help="fake LLM seconds to first token")
+    ap.add_argument("--tokens-per-s", type=float, default=40.0, help="fake LLM decoding speed")
+    ap.add_argument("--net-latency", type=float, default=0.0, help="seconds added to every stand-in response")
+    ap.add_argument("--repeat", type=int, default=10, help="samples per command")
+    ap.add_argument("--warm", type=int, default=3, help="warm setup_rag() samples")
+    ap.add_argument("--rebuild-repeat", type=int, default=2)
+    ap.add_argument("--router-messages", type=int, default=500)
+    ap.add_argument("--queries", type=int, default=100, help="retrieval queries per mode")
+    ap.add_argument("--json", help="write the results to this file")
+    ap.add_argument("--compare", help="earlier --json output to compare against")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = ap.parse_args(argv)
+
+    out = os.path.abspath(args.json) if args.json else None
+    base = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+
+    # the embedding model comes from the local Hugging Face cache
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    # the scratch directory becomes the working directory; imports still come from here
+    sys.path.insert(0, REPO_DIR)
+    cwd = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix="bench-e2e-")
+    os.chdir(scratch)
+    start = time.perf_counter()
+    try:
+        report = run(args, scratch)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"scratch directory: {scratch}", file=sys.stderr)
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+    report["meta"]["wall_s"] = round(time.perf_counter() - start, 1)
+
+    print_results(report)
+    if base is not None:
+        print_comparison(base, report)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# benchmarks/bench_import.py
+"""
+Start-up cost of the entry points, from `python -X importtime`.
+
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --modules main,UI,server --top 15
+    python -m benchmarks.bench_import --json imports.json
+
+Every module is imported in a fresh interpreter, so nothing is already in
+sys.modules. Reported per module: the total import time, the heaviest
+imports under it by cumulative time, and whether anything from HEAVY got
+pulled in. Then, in one more fresh interpreter, the time from launch until
+a ChatEngine(background=True) has answered a slash command, which is what
+a user waits for before the CLI or window is usable; the models keep
+loading behind it.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("main", "UI", "server", "bot_utils")
+# modules that mean the model stack, or a command's dependencies, were imported
+HEAVY = ("torch", "transformers", "sentence_transformers", "faiss", "langchain_community", "langchain",
+         "langdetect", "lxml", "pyrate_limiter")
+
+USABLE_SCRIPT = """
+import os, sys, time
+start = time.perf_counter()
+import main
+engine = main.ChatEngine(background=True)
+engine.respond("/map hayden library")
+print(time.perf_counter() - start, flush=True)
+os._exit(0)
+"""
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """[(module, depth, self us, cumulative us)] in the order Python reports them."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cum_us)))
+    return rows
+
+
+def import_report(module: str, top: int) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=REPO_DIR, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    rows = parse_importtime(proc.stderr)
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"
+        return {"module": module, "error": error}
+    names = {r[0] for r in rows}
+    heaviest = sorted((r for r in rows if r[0] != module), key=lambda r: -r[3])[:top]
+    return {
+        "module": module,
+        "import_ms": round(next(r[3] for r in rows if r[0] == module and r[1] == 0) / 1e3, 1),
+        "process_ms": round(wall * 1e3, 1),
+        "modules_loaded": len(rows),
+        "heavy_loaded": [m for m in HEAVY if m in names],
+        "heaviest": [{"module": n, "cumulative_ms": round(c / 1e3, 1), "self_ms": round(s / 1e3, 1)}
+                     for n, _, s, c in heaviest],
+    }
+
+
+def usable_report() -> dict:
+    """Launch to first slash-command answer, with the models loading in the background."""
+    # from a scratch directory, so the warm-up can't leave an index or caches behind
+    scratch = tempfile.mkdtemp(prefix="bench-import-")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    try:
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", USABLE_SCRIPT], cwd=scratch, env=env,
+                              capture_output=True, text=True)
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if proc.returncode != 0 or not proc.stdout.strip():
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return {"in_process_ms": round(float(proc.stdout.split()[0]) * 1e3, 1), "launch_ms": round(wall * 1e3, 1)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--modules", default=",".join(MODULES))
+    ap.add_argument("--top", type=int, default=10, help="heaviest imports to list per module")
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    reports = [import_report(m, args.top) for m in args.modules.split(",")]
+    usable = usable_report()
+
+    for r in reports:
+        if "error" in r:
+            print(f"{r['module']}: could not import ({r['error']})\n")
+            continue
+        heavy = ", ".join(r["heavy_loaded"]) or "none"
+        print(f"{r['module']}: {r['import_ms']:.1f} ms import, {r['process_ms']:.1f} ms process, "
+              f"{r['modules_loaded']} modules, heavy: {heavy}")
+        for h in r["heaviest"]:
+            print(f"    {h['cumulative_ms']:>9.1f} ms  {h['module']}")
+        print()
+    if "error" in usable:
+        print(f"usable: failed ({usable['error']})")
+    else:
+        print(f"usable: first slash command answered {usable['launch_ms']:.1f} ms after launch "
+              f"({usable['in_process_ms']:.1f} ms of it in-process)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "imports": reports, "usable": usable}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
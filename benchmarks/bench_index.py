@@ -0,0 +1,108 @@
+# benchmarks/bench_index.py
+"""
+Recall vs. latency vs. size for every index spec in vector_store.INDEX_SPECS.
+
+    python -m benchmarks.bench_index                    # our corpus
+    python -m benchmarks.bench_index --synthetic 50000  # clustered fake corpus
+    python -m benchmarks.bench_index --json results.json
+
+Corpus vectors come from the published index's chunk table and the
+embedding cache, so no model is loaded. Queries are corpus vectors with
+noise added; ground truth is an exact numpy search.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from embeddings import EMBED_MODEL
+from rag_engine import current_version
+from vector_store import CHUNKS_FILE, INDEX_SPECS, make_index, tune_index
+
+
+def corpus_vectors() -> np.ndarray:
+    version = current_version()
+    if version is None:
+        sys.exit("No published index; start the bot once or pass --synthetic N.")
+    db = sqlite3.connect(os.path.join(version, CHUNKS_FILE))
+    texts = [r[0] for r in db.execute("SELECT text FROM chunks")]
+    db.close()
+    vectors, missing = EmbeddingCache.open(EMBED_MODEL).get_many(texts)
+    return np.delete(vectors, missing, axis=0)
+
+
+def synthetic_vectors(n: int, dim: int = 384, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+def make_queries(x: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    q = x[rng.integers(0, len(x), n)] + 0.05 * rng.standard_normal((n, x.shape[1])).astype(np.float32)
+    faiss.normalize_L2(q)
+    return q
+
+
+def bench_spec(spec: str, x: np.ndarray, q: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    ids = np.arange(len(x), dtype=np.int64)
+    t0 = time.perf_counter()
+    index = make_index(spec, x, ids)
+    build_s = time.perf_counter() - t0
+    tune_index(index)
+
+    found = np.empty((len(q), k), dtype=np.int64)
+    lat = np.empty(len(q))
+    for i in range(len(q)):          # one query at a time, like a chat turn
+        t = time.perf_counter()
+        _, labels = index.search(q[i:i + 1], k)
+        lat[i] = time.perf_counter() - t
+        found[i] = labels[0]
+
+    recall = np.mean([len(np.intersect1d(found[i], truth[i])) / k for i in range(len(q))])
+    return {
+        "spec": spec,
+        f"recall@{k}": round(float(recall), 4),
+        "p50_ms": round(float(np.percentile(lat, 50)) * 1e3, 4),
+        "p99_ms": round(float(np.percentile(lat, 99)) * 1e3, 4),
+        "bytes_per_vector": round(faiss.serialize_index(index).size / len(x), 1),
+        "build_s": round(build_s, 3),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--synthetic", type=int, default=0, help="use N clustered random vectors")
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("-k", type=int, default=4)
+    ap.add_argument("--specs", default=",".join(INDEX_SPECS))
+    ap.add_argument("--json", help="also write results to this file")
+    args = ap.parse_args(argv)
+
+    x = synthetic_vectors(args.synthetic) if args.synthetic else corpus_vectors()
+    k = min(args.k, len(x))
+    q = make_queries(x, args.queries)
+    truth = np.argsort(-(q @ x.T), axis=1)[:, :k]
+
+    results = [bench_spec(s, x, q, truth, k) for s in args.specs.split(",")]
+    print(f"{len(x)} vectors, dim {x.shape[1]}, {len(q)} queries\n")
+    cols = list(results[0])
+    print("  ".join(f"{c:>16}" for c in cols))
+    for r in results:
+        print("  ".join(f"{r[c]!s:>16}" for c in cols))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"n": len(x), "dim": int(x.shape[1]), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# benchmarks/offline.py
+"""
+Everything the bot reaches over the network, replaced by local stand-ins.
+
+  FakeLLM   deterministic text at a set time-to-first-token and token rate,
+            in place of Ollama (SharedRag(llm=...))
+  StandIn   one local HTTP server for the scraped pages (served from the
+            recorded fixtures, with ETags so conditional GETs get 304s),
+            the Crossref works API and the library-hours feed
+  offline() points web_scraper.URLS, crossref.CROSSREF_URL and
+            bot_utils.HOURS_URL at a StandIn for the duration, and tiktoken
+            at the recorded copy of its encoding
+
+The embedding model is loaded from the local Hugging Face cache, so it has
+to have been downloaded once. tiktoken downloads its encoding on first use;
+without a recorded or cached copy, token counts are estimated instead (see
+chat_memory.py) and the benchmark says so.
+
+    python -m benchmarks.offline --record     # refresh the fixture pages and encoding
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+PAGES_FILE = "pages.json"       # original URL -> fixture path, in scrape order
+TIKTOKEN_DIR = os.path.join(FIXTURES_DIR, "tiktoken")   # a TIKTOKEN_CACHE_DIR
+BENCH_DOI_PREFIX = "10.5555/"   # the DOIs the stand-in Crossref knows
+
+WORDS = ("the writing center helps students plan draft revise and cite their sources in apa mla "
+         "ieee or vancouver style tutors meet online and in person every week of the semester").split()
+
+
+class FakeLLM:
+    """
+    Stands in for the Ollama LLM: `first_token_s` before the first token,
+    then `tokens_per_s`. The reply depends only on the prompt, so two runs
+    see the same text and the same timings.
+    """
+
+    def __init__(self, first_token_s: float = 0.15, tokens_per_s: float = 40.0,
+                 min_tokens: int = 16, max_tokens: int = 64):
+        self.first_token_s = first_token_s
+        self.tokens_per_s = tokens_per_s
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+
+    def reply_tokens(self, prompt: str) -> list[str]:
+        rng = random.Random(hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest())
+        return [rng.choice(WORDS) for _ in range(rng.randint(self.min_tokens, self.max_tokens))]
+
+    def stream(self, prompt, **kwargs):
+        time.sleep(self.first_token_s)
+        for i, token in enumerate(self.reply_tokens(str(prompt))):
+            if i and self.tokens_per_s:
+                time.sleep(1 / self.tokens_per_s)
+            yield token + " "
+
+    def invoke(self, prompt, **kwargs) -> str:
+        return "".join(self.stream(prompt))
+
+
+def load_pages(fixtures: str = FIXTURES_DIR) -> list[tuple[str, bytes]]:
+    """[(original URL, html)] in scrape order."""
+    with open(os.path.join(fixtures, PAGES_FILE), encoding="utf-8") as f:
+        index = json.load(f)
+    out = []
+    for url, path in index.items():
+        with open(os.path.join(fixtures, path), "rb") as f:
+            out.append((url, f.read()))
+    return out
+
+
+def fake_work(doi: str) -> dict:
+    """A complete, deterministic Crossref work for `doi`."""
+    rng = random.Random(doi)
+    families = ["Nguyen", "Patel", "Garcia", "Kim", "Okafor", "Müller", "Rossi", "Lee"]
+    givens = ["Anh", "Priya", "Luis Miguel", "Ji-woo", "Chidi", "Hanna", "Marco", "Sun"]
+    return {
+        "DOI": doi,
+        "type": "journal-article",
+        "title": [" ".join(rng.choice(WORDS) for _ in range(6)).capitalize()],
+        "author": [{"family": rng.choice(families), "given": rng.choice(givens)}
+                   for _ in range(rng.randint(1, 4))],
+        "issued": {"date-parts": [[rng.randint(1995, 2024)]]},
+        "container-title": ["Journal of Writing Research"],
+        "volume": str(rng.randint(1, 40)),
+        "issue": str(rng.randint(1, 6)),
+        "page": f"{rng.randint(1, 200)}-{rng.randint(201, 400)}",
+        "publisher": "Example Press",
+    }
+
+
+def bench_dois(n: int) -> list[str]:
+    return [f"{BENCH_DOI_PREFIX}bench.{i}" for i in range(n)]
+
+
+class StandIn:
+    """
+    Local HTTP server for pages, Crossref and library hours; every response
+    waits `latency` seconds first, to model the network.
+    """
+
+    def __init__(self, fixtures: str = FIXTURES_DIR, latency: float = 0.0):
+        self.pages = load_pages(fixtures)
+        self.latency = latency
+        self.requests = 0
+        etags = [hashlib.sha1(html).hexdigest() for _, html in self.pages]
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive, like the real servers
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes = b"", ctype: str = "application/json", headers=()):
+                self.send_response(status)
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                standin.requests += 1
+                if standin.latency:
+                    time.sleep(standin.latency)
+                path = unquote(self.path)
+                if path.startswith("/pages/"):
+                    i = int(path[len("/pages/"):])
+                    if self.headers.get("If-None-Match") == f'"{etags[i]}"':
+                        return self._send(304, headers=[("ETag", f'"{etags[i]}"')])
+                    return self._send(200, standin.pages[i][1], "text/html; charset=utf-8",
+                                      [("ETag", f'"{etags[i]}"')])
+                if path.startswith("/works/"):
+                    doi = path[len("/works/"):].lower()
+                    if not doi.startswith(BENCH_DOI_PREFIX):
+                        return self._send(404, b"Resource not found.", "text/plain")
+                    body = {"status": "ok", "message-type": "work", "message": fake_work(doi)}
+                    return self._send(200, json.dumps(body).encode("utf-8"))
+                if path == "/hours":
+                    body = {"today": {"date": "2025-01-15", "hours": "7:00am - 12:00am"}}
+                    return self._send(200, json.dumps(body).encode("utf-8"))
+                self._send(404, b"", "text/plain")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+
+    def page_urls(self) -> list[str]:
+        return [f"{self.url}/pages/{i}" for i in range(len(self.pages))]
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def offline(standin: StandIn):
+    """Send the scraper, Crossref lookups and the hours feed to `standin`."""
+    import bot_utils
+    import crossref
+    import web_scraper
+
+    saved = list(web_scraper.URLS), crossref.CROSSREF_URL, bot_utils.HOURS_URL
+    saved_tiktoken = os.environ.get("TIKTOKEN_CACHE_DIR")
+    # in place: ingest imported the same list object
+    web_scraper.URLS[:] = standin.page_urls()
+    crossref.CROSSREF_URL = standin.url + "/works/"
+    bot_utils.HOURS_URL = standin.url + "/hours"
+    if saved_tiktoken is None and os.path.isdir(TIKTOKEN_DIR):
+        os.environ["TIKTOKEN_CACHE_DIR"] = TIKTOKEN_DIR
+    try:
+        yield standin
+    finally:
+        web_scraper.URLS[:], crossref.CROSSREF_URL, bot_utils.HOURS_URL = saved
+        if saved_tiktoken is None:
+            os.environ.pop("TIKTOKEN_CACHE_DIR", None)
+
+
+def record_fixtures(fixtures: str = FIXTURES_DIR) -> None:
+    """Download the live pages in web_scraper.URLS, and tiktoken's encoding, into the fixtures."""
+    import requests
+    import tiktoken
+    from chat_memory import ENCODING
+    from web_scraper import TIMEOUT, URLS
+
+    index = {}
+    os.makedirs(os.path.join(fixtures, "pages"), exist_ok=True)
+    for url in URLS:
+        r = requests.get(url, timeout=TIMEOUT)
+        r.raise_for_status()
+        path = f"pages/{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}.html"
+        with open(os.path.join(fixtures, path), "wb") as f:
+            f.write(r.content)
+        index[url] = path
+        print(f"{len(r.content):>8}  {url}")
+    with open(os.path.join(fixtures, PAGES_FILE), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+
+    os.environ["TIKTOKEN_CACHE_DIR"] = os.path.join(fixtures, "tiktoken")
+    os.makedirs(os.environ["TIKTOKEN_CACHE_DIR"], exist_ok=True)
+    tiktoken.get_encoding(ENCODING)
+    print(f"tiktoken {ENCODING} → {os.environ['TIKTOKEN_CACHE_DIR']}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline stand-ins for the benchmarks")
+    ap.add_argument("--record", action="store_true", help="re-record the fixture pages from the live site")
+    args = ap.parse_args(argv)
+    if args.record:
+        record_fixtures()
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# bm25.py
+"""
+Okapi BM25 over the same chunks as the vector index.
+
+The inverted index is stored as flat numpy arrays (CSR layout: one slice
+of doc positions + term frequencies per term) in bm25.npz, with the
+vocabulary in bm25_vocab.json. Scoring a query touches only the postings
+of its terms.
+"""
+
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+BM25_FILE = "bm25.npz"
+VOCAB_FILE = "bm25_vocab.json"
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, vocab: dict, offsets, postings, tfs, doc_len, doc_ids):
+        self.vocab = vocab            # term -> term number
+        self.offsets = offsets        # (n_terms + 1,) into postings/tfs
+        self.postings = postings      # doc positions, grouped by term
+        self.tfs = tfs                # term frequency per posting
+        self.doc_len = doc_len        # tokens per doc
+        self.doc_ids = doc_ids        # doc position -> faiss id
+        n = len(doc_ids)
+        self.avgdl = float(doc_len.mean()) if n else 0.0
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    @classmethod
+    def build(cls, rows) -> "BM25Index":
+        """`rows` yields (faiss id, text)."""
+        vocab, per_term, tf_per_term = {}, [], []
+        doc_ids, doc_len = [], []
+        for pos, (doc_id, text) in enumerate(rows):
+            counts = Counter(tokenize(text))
+            doc_ids.append(doc_id)
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                t = vocab.setdefault(term, len(vocab))
+                if t == len(per_term):
+                    per_term.append([])
+                    tf_per_term.append([])
+                per_term[t].append(pos)
+                tf_per_term[t].append(tf)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in per_term])
+        postings = np.fromiter((p for plist in per_term for p in plist), dtype=np.int32, count=int(offsets[-1]))
+        tfs = np.fromiter((f for flist in tf_per_term for f in flist), dtype=np.float32, count=int(offsets[-1]))
+        return cls(vocab, offsets, postings, tfs,
+                   np.asarray(doc_len, dtype=np.float32), np.asarray(doc_ids, dtype=np.int64))
+
+    def save(self, path: str) -> None:
+        np.savez(os.path.join(path, BM25_FILE), offsets=self.offsets, postings=self.postings,
+                 tfs=self.tfs, doc_len=self.doc_len, doc_ids=self.doc_ids)
+        with open(os.path.join(path, VOCAB_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str):
+        """None if this version has no lexical index."""
+        try:
+            with open(os.path.join(path, VOCAB_FILE), encoding="utf-8") as f:
+                vocab = json.load(f)
+            arrays = np.load(os.path.join(path, BM25_FILE))
+        except OSError:
+            return None
+        return cls(vocab, arrays["offsets"], arrays["postings"], arrays["tfs"],
+                   arrays["doc_len"], arrays["doc_ids"])
+
+    def search(self, query: str, k: int = 4) -> tuple[list[tuple[int, float]], bool]:
+        """
+        Returns ([(faiss id, score)] best first, all_terms) where all_terms
+        says whether the top hit contains every query term.
+        """
+        query_terms = dict.fromkeys(tokenize(query))
+        terms = [self.vocab[t] for t in query_terms if t in self.vocab]
+        if not terms or not len(self.doc_ids):
+            return [], False
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        matched = np.zeros(len(self.doc_ids), dtype=np.int32)
+        for t in terms:
+            lo, hi = self.offsets[t], self.offsets[t + 1]
+            docs, tf = self.postings[lo:hi], self.tfs[lo:hi]
+            norm = K1 * (1 - B + B * self.doc_len[docs] / self.avgdl)
+            scores[docs] += self.idf[t] * tf * (K1 + 1) / (tf + norm)
+            matched[docs] += 1
+        k = min(k, int((scores > 0).sum()))
+        if k == 0:
+            return [], False
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = [(int(self.doc_ids[i]), float(scores[i])) for i in top]
+        return hits, bool(matched[top[0]] == len(query_terms))
@@ -3,18 +3,18 @@
 Utility helpers for the ASU Writing Support Chatbot
 """
 
-import re, json, subprocess, requests
-from langdetect import detect
-from docx import Document
+import re, json, subprocess
+# requests, language (langdetect), crossref (pyrate_limiter) and citation_audit
+# (lxml) are imported where they are used: main.py imports this module at start-up
+from llm_scheduler import BULK, BULK_TIMEOUT, DeadlineExceeded, scheduled
 
 # ──────────────────────────────────────────────────
 # 1. Language detection
 # ──────────────────────────────────────────────────
 def language_detect_and_prompt(text: str) -> str:
-    try:
-        return detect(text)
-    except Exception:
-        return "en"
+    # seeded, cached, with fast paths for short / single-script text (language.py)
+    from language import detect_language
+    return detect_language(text)
 
 # ──────────────────────────────────────────────────
 # 2. Inline citation (Crossref)
@@ -26,20 +26,27 @@ STYLE_MAP = {
     "vancouver": "vancouver"
 }
 
-def citation_from_text(raw: str, style: str = "apa") -> str:
-    style = STYLE_MAP.get(style.lower(), "apa")
-    doi = (
+def extract_doi(raw: str) -> str:
+    return (
         raw.split("doi.org/")[-1].lstrip().split()[0]
         if "doi" in raw.lower()
         else raw
     )
+
+def citation_from_text(raw: str, style: str = "apa") -> str:
+    from crossref import CrossrefError, get_crossref
+    doi = extract_doi(raw)
     if doi.startswith("https"):
         return "(citation error: not a DOI)"
-    url = f"https://api.crossref.org/works/{doi}"
-    r = requests.get(url, timeout=8)
-    if r.status_code != 200:
-        return f"(citation error: Crossref {r.status_code})"
-    msg = r.json()["message"]
+    try:
+        msg = get_crossref().lookup(doi)
+    except CrossrefError as e:
+        return f"(citation error: {e})"
+    return format_citation(msg, doi, style)
+
+def format_citation(msg: dict, doi: str, style: str = "apa") -> str:
+    """Render Crossref CSL-JSON `msg` in `style`; no network involved."""
+    style = STYLE_MAP.get(style.lower(), "apa")
 
     # authors
     auths = msg.get("author", [])
@@ -82,16 +89,65 @@ def citation_from_text(raw: str, style: str = "apa") -> str:
     # Vancouver
     return f"{auth_str}. {title}. {journal}. {year};{vol}({issue}):{pages}."
 
+DOI_RE = re.compile(r"10\.\d{4,9}/[^\s\"<>]+")
+NUMBERED_STYLES = {"ieee", "vancouver"}
+
+def extract_dois(text: str) -> list[str]:
+    """Every DOI in `text`, normalised, once each, in order of appearance."""
+    from crossref import normalize_doi
+    dois = {}
+    for m in DOI_RE.finditer(text):
+        dois.setdefault(normalize_doi(m.group().rstrip(".,;:)]}'’”")), None)
+    return list(dois)
+
+def document_text(path: str) -> str:
+    # tables and footnotes included; reference lists often live in either
+    from citation_audit import iter_paragraphs
+    return "\n".join(text for _, text in iter_paragraphs(path))
+
+def bibliography(text: str, style: str = "apa") -> str:
+    """
+    Cite every DOI found in `text`, resolved concurrently. APA and MLA lists
+    are sorted alphabetically; IEEE and Vancouver are numbered in order of
+    first appearance, as those styles expect.
+    """
+    from crossref import CrossrefError, get_crossref
+    dois = extract_dois(text)
+    if not dois:
+        return "No DOIs found."
+    works = get_crossref().lookup_many(dois)
+    entries, failed = [], []
+    for doi in dois:
+        work = works[doi]
+        if isinstance(work, CrossrefError):
+            failed.append(f"{doi} ({work})")
+        else:
+            entries.append(format_citation(work, doi, style))
+    if STYLE_MAP.get(style.lower(), "apa") in NUMBERED_STYLES:
+        lines = [f"[{i}] {e}" for i, e in enumerate(entries, 1)]
+    else:
+        lines = sorted(entries, key=str.casefold)
+    if failed:
+        lines += ["", "Could not resolve:"] + [f" • {f}" for f in failed]
+    return "\n".join(lines)
+
 # ──────────────────────────────────────────────────
 # 3. Grammar, Paraphrase, Unpack (plain‑string prompts)
 # ──────────────────────────────────────────────────
+def _bulk_invoke(llm, prompt: str) -> str:
+    # queued behind interactive chat, and given up on if it can't finish in time
+    try:
+        return scheduled(llm, BULK, BULK_TIMEOUT).invoke(prompt)
+    except DeadlineExceeded:
+        return "(the assistant is busy right now—please try again in a minute)"
+
 def grammar_feedback(text: str, llm) -> str:
     prompt = (
         "Improve grammar and clarity of the following passage. "
         "Do NOT change its meaning. Return ONLY the revised passage.\n\n"
         f"{text}\n\nRevised:"
     )
-    return llm.invoke(prompt)
+    return _bulk_invoke(llm, prompt)
 
 def paraphrase(text: str, llm) -> str:
     prompt = (
@@ -100,7 +156,7 @@ def paraphrase(text: str, llm) -> str:
         "Return ONLY the paraphrased version.\n\n"
         f"{text}\n\nParaphrased:"
     )
-    return llm.invoke(prompt)
+    return _bulk_invoke(llm, prompt)
 
 def unpack_assignment(text: str, llm) -> str:
     prompt = (
@@ -110,7 +166,7 @@ def unpack_assignment(text: str, llm) -> str:
         "and suggested first steps. Use bullet points.\n\n"
         f"Assignment:\n{text}"
     )
-    return llm.invoke(prompt)
+    return _bulk_invoke(llm, prompt)
 
 # ──────────────────────────────────────────────────
 # 4. Library hours (with graceful fallback)
@@ -118,6 +174,7 @@ def unpack_assignment(text: str, llm) -> str:
 HOURS_URL = "https://lib.asu.edu/about/hours/json"
 
 def library_hours() -> str:
+    import requests
     try:
         rsp = requests.get(HOURS_URL, timeout=6).json()
         today = rsp.get("today", {})
@@ -157,14 +214,7 @@ def peer_language_fallback(code: str) -> str:
 # ──────────────────────────────────────────────────
 # 8. Missing‑citation checker
 # ──────────────────────────────────────────────────
-QUOTE_RE = re.compile(r'“([^”]{20,})”')
-
 def doc_missing_citations(path: str) -> list[str]:
-    doc = Document(path)
-    txt = "\n".join(p.text for p in doc.paragraphs)
-    offenders = []
-    for quote in QUOTE_RE.findall(txt):
-        if "(cite)" in quote.lower():
-            continue
-        offenders.append(quote[:70] + "…")
-    return offenders
+    """Uncited quotes in a .docx or .txt file, as "location: quote" lines."""
+    from citation_audit import audit_file
+    return [f"{loc}: “{quote}”" for loc, quote in audit_file(path)]
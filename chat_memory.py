@@ -0,0 +1,203 @@
+# chat_memory.py
+"""
+Conversation memory with a hard token budget.
+
+The last KEEP_TURNS exchanges are kept word for word; older ones are
+folded into a running summary by the LLM after they fall out of that
+window, so the history re-sent with every turn stays about the same size
+however long the session runs. Only the user's message and the reply are
+stored, never the retrieved context or the assembled prompt. Sizes are
+measured with tiktoken, or estimated if its encoding can't be loaded (the
+first use downloads it), so counting never fails a turn.
+
+Folding never holds up a reply. Evicted turns wait in `pending` and are
+folded in one batch, either on a background thread right after the turn
+(the default) or, with background=False, only when the history is next
+read, for callers that rarely read it. Until then they are shown word for
+word while they fit the budget, and a failed fold keeps them for the next
+attempt.
+"""
+
+import re
+import threading
+
+import tiktoken
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, get_buffer_string
+
+from llm_scheduler import BULK, BULK_TIMEOUT, INTERACTIVE, scheduled
+
+HISTORY_TOKENS = 1500   # summary + verbatim turns
+SUMMARY_TOKENS = 300
+KEEP_TURNS = 4
+PENDING_TOKENS = 6000   # evicted turns waiting to be folded; the oldest beyond this are dropped
+ENCODING = "cl100k_base"
+
+SUMMARY_TEMPLATE = """Progressively summarize the lines of conversation provided, adding onto the previous summary and returning a new summary. Keep names, courses, deadlines and decisions the student mentioned. Use at most {words} words.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+_encoding = None
+
+
+class _Estimate:
+    """
+    Stands in for the tiktoken encoding when it can't be loaded: pieces of
+    up to four word characters or one symbol, each with the whitespace
+    before it. Counts come out a little above cl100k's, the safe side for a
+    budget, and decode(encode(text)) gives the text back.
+    """
+
+    name = "estimate"
+    _piece = re.compile(r"\s*(?:\w{1,4}|[^\w\s])|\s+$")
+
+    def encode(self, text: str, **kwargs) -> list[str]:
+        return self._piece.findall(text)
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+def _enc():
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(ENCODING)
+        except Exception:
+            # offline with no cached copy of the BPE file
+            _encoding = _Estimate()
+    return _encoding
+
+
+def tokenizer() -> str:
+    """Name of the encoding token counts come from: ENCODING, or "estimate"."""
+    return _enc().name
+
+
+def count_tokens(text: str) -> int:
+    return len(_enc().encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    tokens = _enc().encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else _enc().decode(tokens[:max_tokens]) + "…"
+
+
+class TokenBudgetMemory:
+    """
+    Used like ConversationBufferMemory(memory_key="chat_history"):
+    load_memory_variables() returns the history (a message list, or a
+    string if not `return_messages`), save_context() records one turn.
+    Without an `llm`, turns that leave the window are simply dropped.
+    """
+
+    def __init__(self, llm=None, memory_key: str = "chat_history", return_messages: bool = True,
+                 max_tokens: int = HISTORY_TOKENS, summary_tokens: int = SUMMARY_TOKENS,
+                 keep_turns: int = KEEP_TURNS, background: bool = True):
+        self.llm = llm
+        self.memory_key = memory_key
+        self.return_messages = return_messages
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.keep_turns = keep_turns
+        self.background = background
+        # one stored message may use at most this much, so a single turn always fits
+        self.max_message_tokens = (max_tokens - summary_tokens) // 2
+        self.summary = ""
+        self.turns = []         # [(user text, reply text, tokens)]
+        self.pending = []       # evicted turns not folded into the summary yet
+        self._folding = False   # a background fold is running
+        self._epoch = 0         # bumped by clear(), so a fold in flight is discarded
+        self._lock = threading.Lock()
+
+    @property
+    def memory_variables(self) -> list[str]:
+        return [self.memory_key]
+
+    def messages(self) -> list:
+        if not self.background and self.pending:
+            # the caller is about to build a prompt from this and waits for it
+            self._fold(INTERACTIVE)
+        with self._lock:
+            out = [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}")] if self.summary else []
+            # turns still waiting for a fold, the newest that fit
+            room, waiting = self.max_tokens - self._used(), []
+            for turn in reversed(self.pending):
+                room -= turn[2]
+                if room < 0:
+                    break
+                waiting.insert(0, turn)
+            for human, ai, _ in waiting + self.turns:
+                out += [HumanMessage(content=human), AIMessage(content=ai)]
+        return out
+
+    def load_memory_variables(self, inputs: dict) -> dict:
+        msgs = self.messages()
+        return {self.memory_key: msgs if self.return_messages else get_buffer_string(msgs)}
+
+    def token_count(self) -> int:
+        with self._lock:
+            return self._used()
+
+    def _used(self) -> int:
+        return (count_tokens(self.summary) if self.summary else 0) + sum(t for _, _, t in self.turns)
+
+    def save_context(self, inputs: dict, outputs: dict) -> None:
+        """Records the single input and output value, e.g. {"question": ...}, {"answer": ...}."""
+        human = truncate_tokens(str(next(iter(inputs.values()))), self.max_message_tokens)
+        ai = truncate_tokens(str(next(iter(outputs.values()))), self.max_message_tokens)
+        with self._lock:
+            self.turns.append((human, ai, count_tokens(human) + count_tokens(ai)))
+            while len(self.turns) > 1 and (len(self.turns) > self.keep_turns or self._used() > self.max_tokens):
+                evicted = self.turns.pop(0)
+                if self.llm is not None:
+                    self.pending.append(evicted)
+            while sum(t for _, _, t in self.pending) > PENDING_TOKENS:
+                self.pending.pop(0)
+            start = self.background and bool(self.pending) and not self._folding
+            self._folding = self._folding or start
+        if start:
+            threading.Thread(target=self._fold_loop, name="memory-fold", daemon=True).start()
+
+    def _fold_loop(self) -> None:
+        """Folds until nothing is pending (turns may arrive meanwhile) or a fold fails."""
+        try:
+            while self._fold(BULK, BULK_TIMEOUT):
+                pass
+        finally:
+            with self._lock:
+                self._folding = False
+
+    def _fold(self, priority, timeout: float = None) -> bool:
+        """Folds everything pending into the summary in one call. False if there was nothing to do or it failed."""
+        with self._lock:
+            batch, summary, epoch = list(self.pending), self.summary, self._epoch
+        if not batch:
+            return False
+        lines = get_buffer_string([m for human, ai, _ in batch
+                                   for m in (HumanMessage(content=human), AIMessage(content=ai))])
+        prompt = SUMMARY_TEMPLATE.format(words=int(self.summary_tokens * 0.7),
+                                         summary=summary or "(none)", new_lines=lines)
+        try:
+            summary = scheduled(self.llm, priority, timeout).invoke(prompt).strip()
+        except Exception:
+            return False    # the turns stay pending; the next turn or read tries again
+        with self._lock:
+            if epoch != self._epoch:
+                return False
+            self.summary = truncate_tokens(summary, self.summary_tokens)
+            folded = {id(t) for t in batch}
+            self.pending = [t for t in self.pending if id(t) not in folded]
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self.summary = ""
+            self.turns = []
+            self.pending = []
+            self._epoch += 1
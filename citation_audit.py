@@ -0,0 +1,122 @@
+# citation_audit.py
+"""
+Finds quotations without a citation in .docx and .txt files, streaming.
+
+A .docx is read part by part (body, footnotes, endnotes) with lxml
+iterparse, one paragraph at a time, table cells included; text files are
+read line by line and split into paragraphs at blank lines. Memory stays
+bounded by the largest paragraph, not the document. Batches of files are
+spread over a process pool.
+"""
+
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCX_PARTS = (
+    ("word/document.xml", "¶"),
+    ("word/footnotes.xml", "footnote ¶"),
+    ("word/endnotes.xml", "endnote ¶"),
+)
+EXTENSIONS = (".docx", ".txt")
+AUDIT_WORKERS = min(4, os.cpu_count() or 1)
+SNIPPET = 70
+
+QUOTE_RE = re.compile(r'“([^”]{20,})”')
+
+
+def iter_docx_paragraphs(path: str):
+    """Yields (location, text) for every paragraph of the body, footnotes and endnotes."""
+    with zipfile.ZipFile(path) as zf:
+        names = set(zf.namelist())
+        for part, label in DOCX_PARTS:
+            if part not in names:
+                continue
+            n, tables, depth = 0, 0, 0
+            with zf.open(part) as f:
+                for event, elem in etree.iterparse(f, events=("start", "end"), tag=(W + "p", W + "tbl")):
+                    if elem.tag == W + "tbl":
+                        if event == "start":
+                            tables += 1
+                            depth += 1
+                        else:
+                            depth -= 1
+                            if not depth:
+                                elem.clear()
+                        continue
+                    if event == "start":
+                        continue
+                    n += 1
+                    text = "".join(t.text or "" for t in elem.iter(W + "t"))
+                    if text:
+                        yield f"{label}{n}" + (f" (table {tables})" if depth else ""), text
+                    # drop what has been read so the tree doesn't grow with the document
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+
+
+def iter_text_paragraphs(path: str):
+    """Yields (location, text) per blank-line separated paragraph."""
+    lines, start = [], 0
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for n, line in enumerate(f, 1):
+            if line.strip():
+                if not lines:
+                    start = n
+                lines.append(line.strip())
+            elif lines:
+                yield f"line {start}", " ".join(lines)
+                lines = []
+    if lines:
+        yield f"line {start}", " ".join(lines)
+
+
+def iter_paragraphs(path: str):
+    if path.lower().endswith(".docx"):
+        return iter_docx_paragraphs(path)
+    return iter_text_paragraphs(path)
+
+
+def uncited_quotes(text: str) -> list[str]:
+    return [q[:SNIPPET] + "…" for q in QUOTE_RE.findall(text) if "(cite)" not in q.lower()]
+
+
+def audit_file(path: str) -> list[tuple[str, str]]:
+    """[(location, quote snippet)] for every quote without a citation."""
+    return [(loc, q) for loc, text in iter_paragraphs(path) for q in uncited_quotes(text)]
+
+
+def _audit_one(path: str):
+    try:
+        return audit_file(path)
+    except Exception as e:  # one unreadable file mustn't sink the batch
+        return e
+
+
+def expand(paths: list[str]) -> list[str]:
+    """Files in `paths`, with folders replaced by the .docx/.txt files under them."""
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                out += sorted(os.path.join(root, f) for f in files
+                              if f.lower().endswith(EXTENSIONS) and not f.startswith("~$"))
+        else:
+            out.append(p)
+    return out
+
+
+def audit_files(paths: list[str], workers: int = AUDIT_WORKERS) -> dict:
+    """{path: [(location, snippet)] or the exception that stopped it}, in input order."""
+    files = expand(paths)
+    if workers <= 1 or len(files) <= 1:
+        return {f: _audit_one(f) for f in files}
+    # spawn, not fork: the caller may already be running torch, Qt and scheduler threads
+    with ProcessPoolExecutor(min(workers, len(files)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        return dict(zip(files, pool.map(_audit_one, files)))
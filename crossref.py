@@ -0,0 +1,194 @@
+# crossref.py
+"""
+Crossref works metadata, fetched once per DOI.
+
+DOI → CSL-JSON (the "message" of api.crossref.org/works/{doi}) is kept in
+SQLite with a TTL, with a small in-process LRU in front, so citing the same
+work again (in any style) doesn't touch the network. Fetches share one
+keep-alive session that retries transient failures with backoff. If an
+offline index has been imported (see doi_index.py) it is consulted before
+the network.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from pyrate_limiter import Duration, Limiter, RequestRate
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from telemetry import cache_lookup
+
+CROSSREF_URL = "https://api.crossref.org/works/"
+CACHE_FILE = "crossref_cache.db"
+CACHE_TTL = 30 * 24 * 3600      # found works
+MISS_TTL = 24 * 3600            # DOIs Crossref doesn't know
+MEMO_SIZE = 1024
+TIMEOUT = 8
+POOL_SIZE = 8                   # concurrent lookups (and pooled connections)
+RATE_PER_SECOND = 20            # Crossref requests per second, across threads
+USER_AGENT = "ASU-Writing-Support-Bot/1.0 (https://tutoring.asu.edu/writing-centers)"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS works (
+    doi      TEXT PRIMARY KEY,  -- normalised, see normalize_doi
+    status   INTEGER NOT NULL,  -- HTTP status of the lookup
+    data     TEXT,              -- CSL-JSON message when status is 200
+    fetched  REAL NOT NULL      -- unix time
+)
+"""
+
+_DOI_PREFIX_RE = re.compile(r"^(?:https?://)?(?:dx\.)?(?:doi\.org/)|^doi:\s*", re.I)
+
+
+class CrossrefError(Exception):
+    def __init__(self, status: int = None):
+        super().__init__(f"Crossref {status}" if status else "Crossref unreachable")
+        self.status = status
+
+
+def normalize_doi(doi: str) -> str:
+    """DOIs are case-insensitive; strip resolver prefixes and trailing punctuation."""
+    return _DOI_PREFIX_RE.sub("", doi.strip()).rstrip(".,;").lower()
+
+
+def make_session(pool_size: int = POOL_SIZE) -> requests.Session:
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET",), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+class CrossrefClient:
+    def __init__(self, path: str = CACHE_FILE, ttl: float = CACHE_TTL, miss_ttl: float = MISS_TTL,
+                 session: requests.Session = None, memo_size: int = MEMO_SIZE,
+                 rate: int = RATE_PER_SECOND, local=None):
+        self.local = local          # doi_index.DoiIndex or None
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.session = session or make_session()
+        # only network requests count against the rate; cache hits are free
+        self.limiter = Limiter(RequestRate(rate, Duration.SECOND))
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(_SCHEMA)
+        self._memo = OrderedDict()    # doi -> (status, message, fetched)
+        self._memo_size = memo_size
+        self._lock = threading.Lock()
+
+    def _fresh(self, status: int, fetched: float) -> bool:
+        return time.time() - fetched < (self.ttl if status == 200 else self.miss_ttl)
+
+    def _cached(self, doi: str):
+        with self._lock:
+            hit = self._memo.get(doi)
+            if hit is not None:
+                self._memo.move_to_end(doi)
+                return hit
+            row = self.db.execute("SELECT status, data, fetched FROM works WHERE doi = ?", (doi,)).fetchone()
+        if row is None:
+            return None
+        hit = (row[0], json.loads(row[1]) if row[1] else None, row[2])
+        self._remember(doi, hit)
+        return hit
+
+    def _remember(self, doi: str, entry: tuple) -> None:
+        with self._lock:
+            self._memo[doi] = entry
+            self._memo.move_to_end(doi)
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+
+    def _store(self, doi: str, status: int, message) -> tuple:
+        entry = (status, message, time.time())
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO works (doi, status, data, fetched) VALUES (?, ?, ?, ?)",
+                            (doi, status, json.dumps(message) if message is not None else None, entry[2]))
+            self.db.commit()
+        self._remember(doi, entry)
+        return entry
+
+    def fetch(self, doi: str) -> dict:
+        """Always goes to Crossref (and refreshes the cache)."""
+        doi = normalize_doi(doi)
+        try:
+            with self.limiter.ratelimit("crossref", delay=True):
+                r = self.session.get(CROSSREF_URL + doi, timeout=TIMEOUT)
+        except requests.RequestException:
+            raise CrossrefError()
+        if r.status_code == 200:
+            return self._store(doi, 200, r.json()["message"])[1]
+        if r.status_code == 404:
+            self._store(doi, 404, None)
+        raise CrossrefError(r.status_code)
+
+    def lookup(self, doi: str) -> dict:
+        """
+        CSL-JSON for `doi`: from the cache while it is fresh, else from the
+        offline index, else from Crossref. Raises CrossrefError if Crossref
+        doesn't know the DOI or can't be reached; a stale copy is served
+        rather than failing when it can't.
+        """
+        doi = normalize_doi(doi)
+        hit = self._cached(doi)
+        fresh = hit is not None and self._fresh(hit[0], hit[2])
+        if fresh and hit[0] == 200:
+            cache_lookup("crossref", True)
+            return hit[1]
+        work = self.local.get(doi) if self.local is not None else None
+        if work is not None:
+            cache_lookup("crossref", True)
+            return work
+        if fresh:
+            cache_lookup("crossref", True)
+            raise CrossrefError(hit[0])
+        cache_lookup("crossref", False)
+        try:
+            return self.fetch(doi)
+        except CrossrefError as e:
+            if e.status is None and hit is not None and hit[0] == 200:
+                return hit[1]
+            raise
+
+    def lookup_many(self, dois: list[str], max_workers: int = POOL_SIZE) -> dict:
+        """
+        {doi: CSL-JSON or CrossrefError} for every DOI, looked up
+        concurrently, so a batch takes about as long as its slowest lookup
+        (within the rate limit).
+        """
+        def one(doi):
+            try:
+                return self.lookup(doi)
+            except CrossrefError as e:
+                return e
+
+        dois = list(dict.fromkeys(dois))
+        with ThreadPoolExecutor(max(1, min(max_workers, len(dois)))) as pool:
+            return dict(zip(dois, pool.map(one, dois)))
+
+    def close(self) -> None:
+        self.db.close()
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_crossref() -> CrossrefClient:
+    """Process-wide client, opened on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from doi_index import DoiIndex
+                _client = CrossrefClient(local=DoiIndex.open())
+    return _client
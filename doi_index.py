@@ -0,0 +1,190 @@
+# doi_index.py
+"""
+Offline DOI → metadata index built from a Crossref dump.
+
+    python doi_index.py dump/*.jsonl.gz [--out doi_index]
+
+Accepts JSONL (one work, or one {"message": work} per line) and the JSON
+files of the Crossref public data file ({"items": [...]}), plain or
+gzipped. Each import goes into a fresh v<ns> directory under the index
+directory, which CURRENT then names (as with the FAISS index in
+rag_engine.py), so a process that has the previous version open keeps
+reading it undisturbed. A version holds
+
+  records.bin   the works, trimmed to what format_citation needs, as
+                compact UTF-8 JSON back to back
+  hashes.npy    64-bit hashes of the normalised DOIs, sorted
+  offsets.npy   byte offset of each record in records.bin
+  lengths.npy   byte length of each record
+
+All four are memory-mapped on open, so opening costs the same for any
+size and a lookup is one binary search plus one record read.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from crossref import normalize_doi
+
+DOI_INDEX_DIR = "doi_index"
+RECORDS_FILE = "records.bin"
+CURRENT_FILE = "CURRENT"
+KEEP_FIELDS = ("DOI", "author", "issued", "title", "container-title",
+               "volume", "issue", "page", "type", "publisher")
+
+
+def doi_hash(doi: str) -> int:
+    """`doi` must already be normalised."""
+    return int.from_bytes(hashlib.blake2b(doi.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _open(path: str):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, encoding="utf-8")
+
+
+def iter_works(path: str):
+    """Works from one dump file, JSONL or {"items": [...]}."""
+    with _open(path) as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == "{" and ".jsonl" not in path:
+            try:
+                doc = json.load(f)
+            except ValueError:
+                f.seek(0)
+            else:
+                yield from doc.get("items", [doc.get("message", doc)])
+                return
+        for line in f:
+            line = line.strip()
+            if line:
+                work = json.loads(line)
+                yield work.get("message", work)
+
+
+def trim(work: dict) -> dict:
+    out = {k: work[k] for k in KEEP_FIELDS if k in work}
+    if "author" in out:
+        out["author"] = [{k: a[k] for k in ("family", "given") if k in a} for a in out["author"]]
+    return out
+
+
+def current_version(root: str = DOI_INDEX_DIR):
+    """Directory of the published version, or None."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            version = os.path.join(root, f.read().strip())
+    except OSError:
+        return None
+    return version if os.path.isdir(version) else None
+
+
+def publish(version_dir: str, root: str = DOI_INDEX_DIR) -> None:
+    """Point CURRENT at `version_dir`; keep the version it replaces, delete older ones."""
+    previous = current_version(root)
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+    keep = {os.path.basename(version_dir), os.path.basename(previous or "")}
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith("v") and name not in keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build(paths: list[str], out_dir: str = DOI_INDEX_DIR) -> int:
+    """Import `paths` into a new version under `out_dir` and publish it. Returns the number of works."""
+    version_dir = os.path.join(out_dir, f"v{time.time_ns()}")
+    os.makedirs(version_dir)
+    try:
+        n = _write(paths, version_dir)
+    except BaseException:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    publish(version_dir, out_dir)
+    return n
+
+
+def _write(paths: list[str], out_dir: str) -> int:
+    hashes, offsets, lengths = array("Q"), array("Q"), array("Q")
+    offset = 0
+    with open(os.path.join(out_dir, RECORDS_FILE), "wb") as records:
+        for path in paths:
+            for work in iter_works(path):
+                doi = work.get("DOI")
+                if not doi:
+                    continue
+                doi = normalize_doi(doi)
+                data = json.dumps(trim(work), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                records.write(data)
+                hashes.append(doi_hash(doi))
+                offsets.append(offset)
+                lengths.append(len(data))
+                offset += len(data)
+
+    hashes = np.frombuffer(hashes, dtype=np.uint64)
+    order = np.argsort(hashes, kind="stable")
+    np.save(os.path.join(out_dir, "hashes.npy"), hashes[order])
+    np.save(os.path.join(out_dir, "offsets.npy"), np.frombuffer(offsets, dtype=np.uint64)[order])
+    np.save(os.path.join(out_dir, "lengths.npy"), np.frombuffer(lengths, dtype=np.uint64)[order].astype(np.uint32))
+    return len(order)
+
+
+class DoiIndex:
+    def __init__(self, path: str):
+        """`path` is one version directory; see open()."""
+        self.path = path
+        self.hashes = np.load(os.path.join(path, "hashes.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, "lengths.npy"), mmap_mode="r")
+        size = os.path.getsize(os.path.join(path, RECORDS_FILE))
+        self.records = np.memmap(os.path.join(path, RECORDS_FILE), dtype=np.uint8, mode="r") if size else b""
+
+    @classmethod
+    def open(cls, path: str = DOI_INDEX_DIR):
+        """The version published under `path`, or None if nothing has been imported."""
+        version = current_version(path)
+        return cls(version) if version else None
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def get(self, doi: str):
+        """CSL-JSON subset for `doi`, or None."""
+        doi = normalize_doi(doi)
+        h = np.uint64(doi_hash(doi))
+        i = int(np.searchsorted(self.hashes, h))
+        # equal hashes sit next to each other; the DOI in the record decides
+        while i < len(self.hashes) and self.hashes[i] == h:
+            start = int(self.offsets[i])
+            work = json.loads(bytes(self.records[start:start + int(self.lengths[i])]))
+            if normalize_doi(work["DOI"]) == doi:
+                return work
+            i += 1
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a Crossref dump into a local DOI index")
+    parser.add_argument("paths", nargs="+", help="JSONL or Crossref JSON files, optionally .gz")
+    parser.add_argument("--out", default=DOI_INDEX_DIR)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    n = build(args.paths, args.out)
+    print(f"{n} works indexed into {args.out} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# embedding_cache.py
+"""
+Persistent, content-addressed store of chunk embeddings.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+EMBED_CACHE_DIR = "embedding_cache"
+KEY_BYTES = 20  # sha1 digest
+
+
+def _dir_name(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock between processes, held for the duration."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass    # LK_LOCK gives up after ~10 s; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """
+    One directory per model under `root`:
+
+      vectors.f32  row-major float32 matrix, read through np.memmap
+      keys.bin     sha1(text) digests, 20 bytes each, in row order
+      meta.json    model name and dimension
+      lock         taken by writers
+
+    Rows are append-only. Vectors are flushed before their keys, so a crash
+    can only leave unreferenced trailing rows, which are ignored on open.
+    Several processes (say the server and the CLI) can share a cache: an
+    append holds the lock file, first picks up the rows other processes
+    added and never cuts the files below what is on disk, and a lookup that
+    misses checks for such rows too.
+    """
+
+    def __init__(self, model_name: str, dim: int, root: str = EMBED_CACHE_DIR):
+        self.model_name = model_name
+        self.dim = dim
+        self.dir = os.path.join(root, _dir_name(model_name))
+        os.makedirs(self.dir, exist_ok=True)
+        self._vectors_path = os.path.join(self.dir, "vectors.f32")
+        self._keys_path = os.path.join(self.dir, "keys.bin")
+        self._lock_path = os.path.join(self.dir, "lock")
+        self._lock = threading.Lock()
+
+        meta_path = os.path.join(self.dir, "meta.json")
+        meta = {"model": model_name, "dim": dim}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                if json.load(f) != meta:
+                    raise ValueError(f"{self.dir} holds embeddings for a different model/dim")
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+        self._rows = {}
+        self._n = 0
+        self._mm = None
+        self._refresh()
+
+    @classmethod
+    def open(cls, model_name: str, root: str = EMBED_CACHE_DIR) -> "EmbeddingCache":
+        """Open an existing cache without knowing (or loading) the model."""
+        path = os.path.join(root, _dir_name(model_name), "meta.json")
+        with open(path, encoding="utf-8") as f:
+            return cls(model_name, json.load(f)["dim"], root)
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def _on_disk(self) -> int:
+        """Rows that are complete on disk: both the vector and its key written."""
+        try:
+            n_keys = os.path.getsize(self._keys_path) // KEY_BYTES
+            n_vectors = os.path.getsize(self._vectors_path) // (4 * self.dim)
+        except OSError:
+            return 0
+        return min(n_keys, n_vectors)
+
+    def _refresh(self) -> None:
+        """Take in rows appended since we last looked, by this or another process."""
+        n = self._on_disk()
+        if n <= self._n:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._n * KEY_BYTES)
+            keys = f.read((n - self._n) * KEY_BYTES)
+        for i in range(n - self._n):
+            self._rows.setdefault(keys[i * KEY_BYTES:(i + 1) * KEY_BYTES], self._n + i)
+        self._n = n
+        self._open_map()
+
+    def _open_map(self) -> None:
+        self._mm = (
+            np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._n, self.dim))
+            if self._n else None
+        )
+
+    def __len__(self) -> int:
+        return self._n
+
+    def get_many(self, texts: list[str]) -> tuple[np.ndarray, list[int]]:
+        """
+        Returns (vectors, missing): a (len(texts), dim) array filled for every
+        cached text, and the positions of the texts that still need encoding.
+        """
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        with self._lock:
+            keys = [self.key(t) for t in texts]
+            if any(k not in self._rows for k in keys):
+                self._refresh()     # another process may have embedded them
+            for i, k in enumerate(keys):
+                row = self._rows.get(k)
+                if row is None:
+                    missing.append(i)
+                else:
+                    out[i] = self._mm[row]
+        return out, missing
+
+    def put_many(self, texts: list[str], vectors: np.ndarray) -> None:
+        with self._lock, _file_lock(self._lock_path):
+            # rows other processes appended; ours go after them
+            self._refresh()
+            new_keys, new_rows, seen = [], [], set()
+            for t, v in zip(texts, vectors):
+                k = self.key(t)
+                if k in self._rows or k in seen:
+                    continue
+                seen.add(k)
+                new_keys.append(k)
+                new_rows.append(v)
+            if not new_keys:
+                return
+            block = np.ascontiguousarray(np.stack(new_rows), dtype=np.float32)
+            # truncate any orphaned rows from an interrupted write first; under
+            # the lock, self._n is exactly what is complete on disk
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(self._n * 4 * self.dim)
+                f.write(block.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys_path, "ab") as f:
+                f.truncate(self._n * KEY_BYTES)
+                f.write(b"".join(new_keys))
+            for k in new_keys:
+                self._rows[k] = self._n
+                self._n += 1
+            self._open_map()
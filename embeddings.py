@@ -0,0 +1,110 @@
+# embeddings.py
+"""
+One sentence-transformer shared by the router and the FAISS retriever.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+
+from embedding_cache import EmbeddingCache
+from telemetry import cache_lookup, span
+
+EMBED_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class EmbeddingService(Embeddings):
+    """
+    Owns the only embedding model in the process.
+
+    Vectors are unit-normalised float32. Query embeddings are memoised in a
+    small LRU so the router and the retriever encoding the same message in
+    one turn only pay for a single forward pass. Document embeddings go
+    through the persistent EmbeddingCache, so text embedded by an earlier
+    index build is never run through the model again.
+    """
+
+    def __init__(self, model_name: str = EMBED_MODEL, query_cache_size: int = 256,
+                 use_cache: bool = True):
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.cache = EmbeddingCache(model_name, self.dim) if use_cache else None
+        self._queries = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._lock = threading.Lock()
+
+    def encode(self, texts: list[str], batch_size: int = 64) -> np.ndarray:
+        """(len(texts), dim) unit-length float32 matrix."""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self.model.encode(
+            texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+
+    def encode_documents(self, texts: list[str], batch_size: int = 64) -> np.ndarray:
+        """encode(), backed by the on-disk cache; only unseen texts hit the model."""
+        if self.cache is None:
+            return self.encode(texts, batch_size)
+        out, missing = self.cache.get_many(texts)
+        if missing:
+            todo = [texts[i] for i in missing]
+            fresh = self.encode(todo, batch_size)
+            out[missing] = fresh
+            self.cache.put_many(todo, fresh)
+        return out
+
+    def encode_queries(self, texts: list[str]) -> np.ndarray:
+        """Like encode(), but served from / stored into the per-turn query memo."""
+        out = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for i, t in enumerate(texts):
+                vec = self._queries.get(t)
+                if vec is None:
+                    missing.append(i)
+                else:
+                    self._queries.move_to_end(t)
+                    out[i] = vec
+        cache_lookup("query_embedding", True, len(texts) - len(missing))
+        if missing:
+            cache_lookup("query_embedding", False, len(missing))
+            with span("embed_query"):
+                fresh = self.encode([texts[i] for i in missing])
+            with self._lock:
+                for i, vec in zip(missing, fresh):
+                    out[i] = vec
+                    self._queries[texts[i]] = vec
+                    self._queries.move_to_end(texts[i])
+                while len(self._queries) > self._query_cache_size:
+                    self._queries.popitem(last=False)
+        if not out:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack(out)
+
+    def encode_query(self, text: str) -> np.ndarray:
+        return self.encode_queries([text])[0]
+
+    # ── LangChain Embeddings interface ──
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.encode_documents(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.encode_query(text).tolist()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Process-wide embedding service, built on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
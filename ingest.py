@@ -0,0 +1,208 @@
+# ingest.py
+"""
+Streaming ingestion: fetch → parse → split → embed (batched) → add to index.
+
+Fetches run on a thread pool and parse/split on a process pool; both are
+driven by completion callbacks, so they keep working while the consumer is
+busy embedding. At most SPLIT_QUEUE split pages wait for the consumer (the
+stages upstream pause when it is full), which itself holds one page's
+chunks plus one batch, and a cold build is bounded by the slowest stage
+rather than the sum. The parse workers are spawned, not forked: the
+rebuild runs on a background thread of a process that has torch (and
+maybe Qt) threads running.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from langchain.text_splitter import CharacterTextSplitter
+
+from web_scraper import URLS, MAX_WORKERS, PageCache, fetch_page, make_session, parse_html
+
+CHUNK_SIZE = 400
+CHUNK_OVERLAP = 50
+BATCH_SIZE = 64
+PARSE_WORKERS = min(4, os.cpu_count() or 1)   # 0 parses inline
+SPLIT_QUEUE = 8                               # split pages waiting to be embedded
+EMBED_THREADS = None                          # torch intra-op threads; None keeps torch's default
+
+
+def _sha1(*parts: str) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def split_page(url: str, text: str) -> dict:
+    """{chunk id: chunk text}; the id is a hash of the source and the chunk."""
+    splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = {}
+    for chunk in splitter.split_text(text):
+        chunks.setdefault(_sha1(url, chunk), chunk)
+    return chunks
+
+
+def _parse_and_split(url: str, html: str, text: str) -> tuple:
+    """Process-pool worker: (text, chunks). `html` is empty when text is already known."""
+    if html:
+        text = parse_html(html)
+    return text, split_page(url, text)
+
+
+class _Inline:
+    """Executor stand-in for PARSE_WORKERS = 0."""
+
+    def submit(self, fn, *args):
+        fut = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def split_pages(urls: list[str], manifest: dict, cache: PageCache,
+                parse_workers: int = PARSE_WORKERS, fetch_workers: int = MAX_WORKERS):
+    """
+    Stages 1-3. Yields (url, chunks) for every page whose text changed since
+    `manifest`, in completion order, and records its new hash in the
+    manifest. Unchanged pages are never parsed or split.
+    """
+    known = manifest["pages"]
+    done = queue.Queue(SPLIT_QUEUE)
+    stopped = threading.Event()     # the consumer is gone; drop what's still coming
+    parse_pool = (ProcessPoolExecutor(parse_workers, mp_context=multiprocessing.get_context("spawn"))
+                  if parse_workers else _Inline())
+
+    def put(item):
+        # blocks while the consumer is behind, but never past its leaving
+        while not stopped.is_set():
+            try:
+                done.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def on_split(url, fut):
+        try:
+            text, chunks = fut.result()
+        except Exception:
+            put((url, None, None))
+            return
+        put((url, text, chunks))
+
+    def on_fetched(url, fut):
+        try:
+            page = fut.result()
+            if page.html:
+                html, text = page.html, ""
+            else:
+                html, text = "", page.text
+                entry = known.get(url)
+                if not text.strip() or (entry and entry["sha1"] == _sha1(text)):
+                    put((url, None, None))
+                    return
+            f = parse_pool.submit(_parse_and_split, url, html, text)
+        except Exception:
+            # every URL must produce exactly one item or the consumer blocks
+            put((url, None, None))
+            return
+        if page.html:
+            f.add_done_callback(lambda f, p=page: _store(p, f))
+        f.add_done_callback(lambda f, u=url: on_split(u, f))
+
+    def _store(page, fut):
+        if fut.exception() is None:
+            cache.store(page.url, page.html, fut.result()[0], page.headers)
+
+    try:
+        with make_session(fetch_workers) as session, ThreadPoolExecutor(fetch_workers) as fetch_pool:
+            try:
+                for url in urls:
+                    fetch_pool.submit(fetch_page, session, cache, url, False).add_done_callback(
+                        lambda f, u=url: on_fetched(u, f))
+                for _ in urls:
+                    url, text, chunks = done.get()
+                    if chunks is None:
+                        continue
+                    page_hash = _sha1(text)
+                    entry = known.get(url)
+                    if entry and entry["sha1"] == page_hash:
+                        continue
+                    yield url, chunks
+                    # recorded only once the consumer has taken the chunks
+                    known[url] = {"sha1": page_hash, "chunks": list(chunks)}
+            finally:
+                # before the pools wait for their threads, which may be blocked in put()
+                stopped.set()
+    finally:
+        parse_pool.shutdown(wait=True)
+        cache.save()
+
+
+def new_chunks(split, manifest: dict, stale: list):
+    """Stage 4. Yields (id, text, metadata) not yet in the index; collects removed ids into `stale`."""
+    for url, chunks in split:
+        entry = manifest["pages"].get(url)
+        old = set(entry["chunks"]) if entry else set()
+        for cid, chunk in chunks.items():
+            if cid not in old:
+                yield cid, chunk, {"source": url}
+        stale.extend(old.difference(chunks))
+
+
+def batched(items, size: int = BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embedded(batches, embeddings):
+    """Stage 5. Yields (ids, texts, metadatas, vectors) per batch."""
+    for batch in batches:
+        ids, texts, metas = zip(*batch)
+        yield list(ids), list(texts), list(metas), embeddings.encode_documents(list(texts), len(texts))
+
+
+def ingest(vs, embeddings, manifest: dict, urls: list[str] = None,
+           batch_size: int = BATCH_SIZE, parse_workers: int = PARSE_WORKERS,
+           embed_threads: int = EMBED_THREADS, cache: PageCache = None):
+    """
+    Stream `urls` into the writable VectorStore `vs` and update `manifest`
+    in place to match. Returns `vs`.
+    """
+    urls = URLS if urls is None else urls
+    if embed_threads:
+        import torch
+        # process-wide: put it back for query-time embedding once we're done
+        saved_threads = torch.get_num_threads()
+        torch.set_num_threads(embed_threads)
+    try:
+        stale = []
+        split = split_pages(urls, manifest, cache or PageCache(), parse_workers)
+        for ids, texts, metas, vectors in embedded(batched(new_chunks(split, manifest, stale), batch_size), embeddings):
+            vs.add(ids, texts, metas, vectors)
+
+        wanted = set(urls)
+        for url in [u for u in manifest["pages"] if u not in wanted]:
+            stale.extend(manifest["pages"].pop(url)["chunks"])
+        if stale:
+            vs.delete(stale)
+    finally:
+        if embed_threads:
+            torch.set_num_threads(saved_threads)
+    return vs
@@ -0,0 +1,155 @@
+# language.py
+"""
+Language identification for incoming messages.
+
+langdetect is used with its profiles loaded once, up front, and a fixed
+seed, so the same text always gets the same answer. It only runs when the
+cheap checks can't decide:
+
+  * text written in a script that belongs to one language (Hangul, kana,
+    Thai, Greek, ...) is answered from the script alone, and Han text is
+    only asked whether it is simplified or traditional Chinese;
+  * short text is taken to be DEFAULT_LANG, and ASCII text of a few words
+    or more that is dominated by English-only function words is English.
+
+Results are memoised in an LRU keyed by the text.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+from langdetect.detector_factory import PROFILES_DIRECTORY, DetectorFactory
+from langdetect.lang_detect_exception import LangDetectException
+
+from telemetry import cache_lookup
+
+DEFAULT_LANG = "en"
+MIN_CHARS = 12          # below this (letters only) langdetect is mostly noise
+SEED = 0
+CACHE_SIZE = 4096
+
+# Unicode ranges → the one langdetect code written in that script
+SCRIPTS = (
+    (0xAC00, 0xD7AF, "ko"),     # Hangul syllables
+    (0x1100, 0x11FF, "ko"),     # Hangul jamo
+    (0x3040, 0x30FF, "ja"),     # hiragana + katakana
+    (0x4E00, 0x9FFF, "zh"),     # Han without kana: Chinese, variant decided below
+    (0x0E00, 0x0E7F, "th"),
+    (0x0370, 0x03FF, "el"),
+    (0x0590, 0x05FF, "he"),
+    (0x0980, 0x09FF, "bn"),
+    (0x0A00, 0x0A7F, "pa"),     # Gurmukhi
+    (0x0A80, 0x0AFF, "gu"),
+    (0x0B80, 0x0BFF, "ta"),
+    (0x0C00, 0x0C7F, "te"),
+    (0x0C80, 0x0CFF, "kn"),
+    (0x0D00, 0x0D7F, "ml"),
+)
+SCRIPT_SHARE = 0.3      # share of letters in one script that settles it
+
+# only words no Romance language also uses (no "a", "me", "in", "so", "do", ...),
+# so Spanish or Portuguese typed without accents never scores here
+ENGLISH_WORDS = frozenset(
+    "the an and but of to for with is are was were be been it this that these those "
+    "you she we they my your our their there how what why when where which who can "
+    "could should would does did not have has had will about from at by if any need".split()
+)
+ENGLISH_MIN_WORDS = 4   # fewer words than this go to langdetect
+ENGLISH_SHARE = 0.3     # share of English function words in ASCII text that settles it
+
+_WORD_RE = re.compile(r"[A-Za-z']+")
+
+
+def _script_lang(text: str):
+    letters = [c for c in text if c.isalpha()]
+    counts = {}
+    for c in letters:
+        o = ord(c)
+        if o < 0x0370:
+            continue
+        for lo, hi, lang in SCRIPTS:
+            if lo <= o <= hi:
+                counts[lang] = counts.get(lang, 0) + 1
+                break
+    if not counts:
+        return None
+    # any kana means Japanese, even when kanji make up most of the text
+    if "ja" in counts:
+        return "ja"
+    lang, n = max(counts.items(), key=lambda kv: kv[1])
+    return lang if n >= SCRIPT_SHARE * len(letters) else None
+
+
+class LanguageDetector:
+    def __init__(self, seed: int = SEED, cache_size: int = CACHE_SIZE, default: str = DEFAULT_LANG):
+        self.factory = DetectorFactory()
+        self.factory.load_profile(PROFILES_DIRECTORY)
+        self.factory.set_seed(seed)
+        self.default = default
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def _detect(self, text: str) -> str:
+        lang = _script_lang(text)
+        if lang == "zh":
+            # langdetect only needs to tell simplified from traditional here
+            guess = self._langdetect(text)
+            return guess if guess.startswith("zh") else "zh-cn"
+        if lang:
+            return lang
+        if sum(c.isalpha() for c in text) < MIN_CHARS:
+            return self.default
+        if text.isascii():
+            words = _WORD_RE.findall(text.lower())
+            if len(words) >= ENGLISH_MIN_WORDS and sum(w in ENGLISH_WORDS for w in words) >= ENGLISH_SHARE * len(words):
+                return "en"
+        return self._langdetect(text)
+
+    def _langdetect(self, text: str) -> str:
+        try:
+            detector = self.factory.create()
+            detector.append(text)
+            return detector.detect()
+        except LangDetectException:
+            return self.default
+
+    def detect(self, text: str) -> str:
+        text = text.strip()
+        with self._lock:
+            lang = self._cache.get(text)
+            if lang is not None:
+                self._cache.move_to_end(text)
+        cache_lookup("language", lang is not None)
+        if lang is not None:
+            return lang
+        lang = self._detect(text)
+        with self._lock:
+            self._cache[text] = lang
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return lang
+
+    def detect_many(self, texts: list[str]) -> list[str]:
+        """detect() for each text; repeated texts are only classified once."""
+        seen = {}
+        return [seen[t] if t in seen else seen.setdefault(t, self.detect(t)) for t in texts]
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> LanguageDetector:
+    """Process-wide detector; the first call loads the profiles (~0.5 s)."""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = LanguageDetector()
+    return _detector
+
+
+def detect_language(text: str) -> str:
+    return get_detector().detect(text)
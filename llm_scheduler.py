@@ -0,0 +1,176 @@
+# llm_scheduler.py
+"""
+One queue in front of Ollama.
+
+Every LLM call takes a slot from the process-wide LLMScheduler first. At
+most MAX_IN_FLIGHT calls run at once; the rest wait in priority order
+(INTERACTIVE chat before BULK rewrites such as /proofread or /unpack, FIFO
+within a class). A call may carry a deadline: it gives up with
+DeadlineExceeded if it can't start in time, and a stream is cut off once
+the deadline passes (a blocking invoke can't be interrupted and runs to
+the end).
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+
+from telemetry import observe_stage
+
+MAX_IN_FLIGHT = 2       # concurrent Ollama requests (match OLLAMA_NUM_PARALLEL)
+BULK_TIMEOUT = 120      # seconds a bulk rewrite may take, queueing included
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+INTERACTIVE = Priority.INTERACTIVE
+BULK = Priority.BULK
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class LLMScheduler:
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._cond = threading.Condition()
+        self._queue = []            # heap of (priority, seq, ticket)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._queued = {p: 0 for p in Priority}
+        self._started = {p: 0 for p in Priority}
+        self._completed = {p: 0 for p in Priority}
+        self._expired = {p: 0 for p in Priority}
+        self._waited = {p: 0.0 for p in Priority}   # total queueing seconds
+
+    def acquire(self, priority: Priority = INTERACTIVE, deadline: float = None) -> None:
+        """
+        Block until a slot is free and no earlier or higher-priority call is
+        waiting. `deadline` is a time.monotonic() value.
+        """
+        ticket = {"cancelled": False}
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, (priority, next(self._seq), ticket))
+            self._queued[priority] += 1
+            try:
+                while True:
+                    while self._queue[0][2]["cancelled"]:
+                        heapq.heappop(self._queue)
+                    if self._queue[0][2] is ticket and self._in_flight < self.max_in_flight:
+                        heapq.heappop(self._queue)
+                        if self._in_flight + 1 < self.max_in_flight:
+                            # another slot is free and the next waiter may
+                            # have woken before us and gone back to sleep
+                            self._cond.notify_all()
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._expired[priority] += 1
+                        raise DeadlineExceeded(f"{priority.name.lower()} LLM call waited too long for a slot")
+                    self._cond.wait(remaining)
+            except BaseException:
+                ticket["cancelled"] = True
+                self._cond.notify_all()     # the head of the queue may have changed
+                raise
+            finally:
+                self._queued[priority] -= 1
+            self._in_flight += 1
+            self._started[priority] += 1
+            waited = time.monotonic() - start
+            self._waited[priority] += waited
+        observe_stage("llm_queue", waited)
+
+    def release(self, priority: Priority = INTERACTIVE) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._completed[priority] += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: Priority = INTERACTIVE, deadline: float = None):
+        self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def metrics(self) -> dict:
+        """Queue depth, calls in flight and per-class counters."""
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queued": {p.name.lower(): n for p, n in self._queued.items()},
+                "completed": {p.name.lower(): n for p, n in self._completed.items()},
+                "expired": {p.name.lower(): n for p, n in self._expired.items()},
+                "mean_wait_ms": {
+                    p.name.lower(): round(1000 * self._waited[p] / n, 1) if n else 0.0
+                    for p, n in self._started.items()
+                },
+            }
+
+
+class ScheduledLLM:
+    """
+    Stands in for an LLM: invoke() and stream() go through the scheduler
+    under this proxy's priority and timeout, anything else is passed through.
+    """
+
+    def __init__(self, llm, scheduler: LLMScheduler = None, priority: Priority = INTERACTIVE,
+                 timeout: float = None):
+        self.llm = llm
+        self.scheduler = scheduler or get_scheduler()
+        self.priority = priority
+        self.timeout = timeout
+
+    def with_priority(self, priority: Priority, timeout: float = None) -> "ScheduledLLM":
+        """Same model and scheduler, different class of service."""
+        return ScheduledLLM(self.llm, self.scheduler, priority, timeout)
+
+    def _deadline(self):
+        return None if self.timeout is None else time.monotonic() + self.timeout
+
+    def invoke(self, prompt, **kwargs):
+        with self.scheduler.slot(self.priority, self._deadline()):
+            return self.llm.invoke(prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        # the slot is held until the stream is exhausted or closed
+        deadline = self._deadline()
+        with self.scheduler.slot(self.priority, deadline):
+            for chunk in self.llm.stream(prompt, **kwargs):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise DeadlineExceeded("LLM stream ran past its deadline")
+                yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+def scheduled(llm, priority: Priority = INTERACTIVE, timeout: float = None) -> ScheduledLLM:
+    """`llm` behind the process-wide scheduler (re-prioritised if it already is)."""
+    if isinstance(llm, ScheduledLLM):
+        return llm.with_priority(priority, timeout)
+    return ScheduledLLM(llm, get_scheduler(), priority, timeout)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Process-wide scheduler, built on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
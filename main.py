@@ -1,33 +1,249 @@
 # main.py
-import re, sys, os
-from rag_engine import setup_rag
+# Only light modules are imported up front. The RAG stack (langchain, torch,
+# faiss, the embedding model) is imported and loaded by load_shared(),
+# optionally on a background thread (warm_up), so the prompt comes up at once.
+import re, sys, os, shlex, threading
+from concurrent.futures import Future
 from bot_utils import (
     language_detect_and_prompt, citation_from_text,
     grammar_feedback, paraphrase, library_hours, map_link,
     unpack_assignment, triage_resources, peer_language_fallback,
-    doc_missing_citations
+    bibliography, document_text
 )
+from telemetry import span, trace
+
+# slash commands that get their own label in traces; anything else is "chat"
+TRACED_COMMANDS = {"cite", "bib", "upload", "proofread", "paraphrase", "hours", "map", "unpack", "resources"}
+
+
+def turn_kind(user_raw: str) -> str:
+    m = re.match(r"/(\w+)", user_raw)
+    if m and m.group(1).lower() in TRACED_COMMANDS:
+        return m.group(1).lower()
+    return user_raw.lower() if user_raw.lower() in ("refresh", "help") else "chat"
+
 
 COMMANDS = """
 /cite <APA|MLA|IEEE|Vancouver> <doi|url|title>
+/bib <APA|MLA|IEEE|Vancouver> <reference list | path-to-docx/txt>
 /proofread <text>
 /paraphrase <text>
 /hours
 /map <building>
 /unpack <assignment description>
 /resources <visa|health|finance>
-/upload <path-to-docx>
+/upload <.docx/.txt files or folders>
 """
 
+def bulk_citations(arg: str, style: str, allow_files: bool = True) -> str:
+    """`arg` is either pasted text or the path of a document to scan for DOIs."""
+    path = os.path.expanduser(arg.strip())
+    text = document_text(path) if allow_files and os.path.isfile(path) else arg
+    return bibliography(text, style)
+
+def citation_audit(arg: str) -> str:
+    """Report for /upload: `arg` is one path, or several (quote those with spaces)."""
+    arg = arg.strip()
+    if os.path.exists(os.path.expanduser(arg)):
+        paths = [arg]
+    else:
+        paths = [p.strip("\"'") for p in shlex.split(arg, posix=False)]
+    paths = [os.path.expanduser(p) for p in paths]
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        return "File not found: " + ", ".join(missing)
+
+    from citation_audit import audit_files   # lxml; only /upload needs it
+    results = audit_files(paths)
+    if not results:
+        return "No .docx or .txt files found."
+    lines = []
+    for path, offenders in results.items():
+        prefix = f"{path}: " if len(results) > 1 else ""
+        if isinstance(offenders, Exception):
+            lines.append(f"{prefix}could not read ({offenders})")
+        elif offenders:
+            lines.append(f"{prefix}Possible uncited quotes:")
+            lines += [f" • {loc}: “{quote}”" for loc, quote in offenders]
+        else:
+            lines.append(f"{prefix}No obvious uncited quotes.")
+    return "\n".join(lines)
+
+LOADING_NOTICE = "⏳ Still loading the models, one moment…\n\n"
+
+
+def load_shared(refresh: bool = False, index_spec: str = None, retrieval_mode: str = None):
+    """Import the RAG stack and build a SharedRag (models, index); takes seconds."""
+    from rag_engine import SharedRag
+    opts = {k: v for k, v in (("index_spec", index_spec), ("retrieval_mode", retrieval_mode)) if v}
+    return SharedRag(refresh=refresh, **opts)
+
+
+def warm_up(refresh: bool = False, index_spec: str = None, retrieval_mode: str = None) -> Future:
+    """
+    load_shared() on a daemon thread (so exiting early doesn't wait for it),
+    while Ollama loads the chat model. The Future resolves to the SharedRag.
+    """
+    future = Future()
+
+    def run():
+        from ollama_session import preload_model
+        threading.Thread(target=preload_model, name="ollama-preload", daemon=True).start()
+        try:
+            future.set_result(load_shared(refresh, index_spec, retrieval_mode))
+        except BaseException as e:
+            future.set_exception(e)
+
+    future.set_running_or_notify_cancel()
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
+    return future
+
+
+def _forward(inner: Future, outer: Future) -> None:
+    """Resolve `outer` the way `inner` resolves."""
+    def done(f):
+        if f.cancelled():
+            outer.cancel()
+        elif f.exception() is not None:
+            outer.set_exception(f.exception())
+        else:
+            outer.set_result(f.result())
+    inner.add_done_callback(done)
+
+
 class ChatEngine:
     """
     A single‐call wrapper around your RAG + utility commands.
     """
-    def __init__(self, refresh: bool = False):
-        # load (or rebuild) your FAISS index and LLM once
-        self.qa, self.llm = setup_rag(refresh=refresh)
+    def __init__(self, refresh: bool = False, index_spec: str = None,
+                 retrieval_mode: str = None, shared=None,
+                 local_files: bool = True, background: bool = False,
+                 allow_refresh: bool = True):
+        # load (or rebuild) your FAISS index and LLM once; pass `shared` to
+        # reuse them across engines (one per session, see server.py)
+        # local_files: whether commands may read paths on this machine
+        # allow_refresh: whether `refresh` may rebuild the index shared by everyone
+        # background: load on a thread and return at once; commands that
+        #   don't need the models (help, /hours, /map, /cite, ...) work meanwhile
+        self.local_files = local_files
+        self.allow_refresh = allow_refresh
+        if shared is None and background:
+            self._shared = warm_up(refresh, index_spec, retrieval_mode)
+        else:
+            self._shared = Future()
+            self._shared.set_result(shared or load_shared(refresh, index_spec, retrieval_mode))
+        self._lock = threading.Lock()
+        self._files = None      # the user's own files, searched alongside the shared index
+        self._qa = None
+        self._pending = {}      # path -> Future, for files added while loading
+        self._closed = False
+        self._shared.add_done_callback(self._on_loaded)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the models and index are loaded (or failed to load)."""
+        return self._shared.done()
+
+    @property
+    def shared(self):
+        """The SharedRag; blocks while loading, raises if loading failed."""
+        return self._shared.result()
+
+    @property
+    def llm(self):
+        return self.shared.llm
+
+    def _session(self) -> None:
+        # with self._lock held, once the SharedRag is there
+        if self._qa is None:
+            from session_index import SessionIndex
+            self._files = SessionIndex(self.shared.embeddings)
+            self._qa = self.shared.new_chain(session_index=self._files)
+
+    @property
+    def files(self):
+        self._shared.result()
+        with self._lock:
+            self._session()
+            return self._files
+
+    @property
+    def qa(self):
+        self._shared.result()
+        with self._lock:
+            self._session()
+            return self._qa
+
+    def _on_loaded(self, future: Future) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if future.exception() is not None or self._closed:
+                for f in pending.values():
+                    f.cancel()
+                return
+            self._session()
+            for path, outer in pending.items():
+                _forward(self._files.add_file(path), outer)
+
+    def add_file(self, path: str) -> Future:
+        """Index a .txt/.docx in the background (after loading, if need be); returns a Future."""
+        with self._lock:
+            if not self.ready:
+                outer = self._pending[path] = Future()
+                outer.set_running_or_notify_cancel()
+                return outer
+        return self.files.add_file(path)
+
+    def remove_file(self, path: str) -> None:
+        with self._lock:
+            pending = self._pending.pop(path, None)
+            if pending is not None:
+                pending.cancel()
+            if self._files is not None:
+                self._files.remove_file(path)
+
+    def close(self) -> None:
+        """End of session: free the per-session file index."""
+        with self._lock:
+            self._closed = True
+            for f in self._pending.values():
+                f.cancel()
+            self._pending.clear()
+            if self._files is not None:
+                self._files.close()
+
+    def _until_ready(self):
+        """Before a step that needs the models: say so if they are still loading, then wait."""
+        if not self.ready:
+            yield LOADING_NOTICE
+        self._shared.result()
+
+    @property
+    def rebuild_status(self) -> str:
+        return self.shared.rebuild_status if self.ready else "loading"
+
+    def start_rebuild(self) -> bool:
+        """
+        Rebuild the index on a background thread. Answers keep coming from the
+        current index; when the new version is published it is swapped in for
+        every engine on the same SharedRag, so chat memory survives.
+        Returns False if a rebuild is already running.
+        """
+        return self.shared.start_rebuild()
 
     def respond(self, user_raw: str) -> str:
+        return "".join(self.respond_stream(user_raw))
+
+    def respond_stream(self, user_raw: str):
+        """
+        Same as respond(), but yields the reply in pieces: RAG answers token
+        by token as the LLM streams them, everything else in one piece.
+        Each turn is one trace (see telemetry.py).
+        """
+        with trace(turn_kind(user_raw)):
+            yield from self._respond_stream(user_raw)
+
+    def _respond_stream(self, user_raw: str):
         import re
         # bring in your helpers
         from bot_utils import (
@@ -36,58 +252,104 @@ class ChatEngine:
             map_link, unpack_assignment, triage_resources,
             peer_language_fallback
         )
-        # exact same logic you had in the CLI loop, but RETURN instead of print
+        # exact same logic you had in the CLI loop, but YIELD instead of print
         cmd_low = user_raw.lower()
 
         if cmd_low == "refresh":
-            self.qa, self.llm = setup_rag(refresh=True)
-            return "🔄 Index rebuilt."
+            if not self.allow_refresh:
+                yield "🔒 Rebuilding the index isn't available here."
+                return
+            yield from self._until_ready()
+            if not self.start_rebuild():
+                yield "⏳ An index rebuild is already running."
+            else:
+                yield "🔄 Rebuilding the index in the background; answers use the current index until it's ready."
+            return
 
         if cmd_low == "help":
-            return COMMANDS
+            yield COMMANDS
+            return
 
         m = re.match(r"/cite\s+(\w+)\s+(.+)", user_raw, re.I)
         if m:
-            return citation_from_text(m.group(2), m.group(1))
+            yield citation_from_text(m.group(2), m.group(1))
+            return
+
+        m = re.match(r"/bib\s+(\w+)\s+(.+)", user_raw, re.I | re.S)
+        if m:
+            yield bulk_citations(m.group(2), m.group(1), self.local_files)
+            return
+
+        m = re.match(r"/upload\s+(.+)", user_raw, re.I)
+        if m:
+            if not self.local_files:
+                yield "🔒 Auditing files on the server isn't available here."
+                return
+            yield citation_audit(m.group(1))
+            return
 
         if cmd_low.startswith("/proofread "):
-            return grammar_feedback(user_raw[11:], self.llm)
+            yield from self._until_ready()
+            yield grammar_feedback(user_raw[11:], self.llm)
+            return
 
         if cmd_low.startswith("/paraphrase "):
-            return paraphrase(user_raw[12:], self.llm)
+            yield from self._until_ready()
+            yield paraphrase(user_raw[12:], self.llm)
+            return
 
         if cmd_low == "/hours":
-            return library_hours()
+            yield library_hours()
+            return
 
         m = re.match(r"/map\s+(.+)", user_raw, re.I)
         if m:
-            return "🗺️ " + map_link(m.group(1))
+            yield "🗺️ " + map_link(m.group(1))
+            return
 
         if cmd_low.startswith("/unpack "):
-            return unpack_assignment(user_raw[8:], self.llm)
+            yield from self._until_ready()
+            yield unpack_assignment(user_raw[8:], self.llm)
+            return
 
         m = re.match(r"/resources\s+(\w+)", user_raw, re.I)
         if m:
-            return triage_resources(m.group(1))
+            yield triage_resources(m.group(1))
+            return
 
         # fallback to RAG retrieval
-        lang   = language_detect_and_prompt(user_raw)
-        # result = self.qa({"query": user_raw})["result"]
-        result = self.qa({"question": user_raw})["answer"]
+        yield from self._until_ready()
+        with span("language"):
+            lang = language_detect_and_prompt(user_raw)
+        yield from self.qa.ask_stream(user_raw, lang)
         club   = peer_language_fallback(lang)
         if club:
-            result += f"\n\n🔗 You might also connect with a cultural club: {club}"
-        return result
+            yield f"\n\n🔗 You might also connect with a cultural club: {club}"
 
 
 def main():
-    qa, llm = setup_rag()
+    # the prompt is up at once; models load behind it
+    engine = ChatEngine(background=True)
+
+    def loaded() -> ChatEngine:
+        if not engine.ready:
+            print(LOADING_NOTICE.strip())
+        engine.shared  # waits, or raises what went wrong
+        return engine
 
     print("📚 ASU Writing Support Chatbot")
     print("Type 'refresh', 'help', or 'exit'.\n")
 
+    rebuilding = False
     while True:
         user_raw = input("You: ").strip()
+        # a background rebuild finished since the last prompt
+        if rebuilding and engine.rebuild_status != "running":
+            rebuilding = False
+            if engine.rebuild_status == "done":
+                print("✅ Index rebuilt.\n")
+            else:
+                print(f"⚠️ Index rebuild {engine.rebuild_status}\n")
         if not user_raw:
             continue
 
@@ -97,9 +359,12 @@ def main():
         if cmd_low == "exit":
             break
         if cmd_low == "refresh":
-            print("🔄 Rebuilding index…")
-            qa, llm = setup_rag(refresh=True)
-            print("✅ Done!\n")
+            shared = loaded().shared
+            if not shared.start_rebuild():
+                print("⏳ An index rebuild is already running.\n")
+            else:
+                rebuilding = True
+                print("🔄 Rebuilding the index in the background; answers use the current index until it's ready.\n")
             continue
         if cmd_low == "help":
             print(COMMANDS)
@@ -111,16 +376,22 @@ def main():
             print("Bot:", citation_from_text(m.group(2), m.group(1)), "\n")
             continue
 
+        # /bib
+        m = re.match(r"/bib\s+(\w+)\s+(.+)", user_raw, re.I | re.S)
+        if m:
+            print("Bot:", bulk_citations(m.group(2), m.group(1)), "\n")
+            continue
+
         # /proofread
         if cmd_low.startswith("/proofread "):
             text = user_raw[11:]
-            print("Bot:", grammar_feedback(text, llm), "\n")
+            print("Bot:", grammar_feedback(text, loaded().llm), "\n")
             continue
 
         # /paraphrase
         if cmd_low.startswith("/paraphrase "):
             text = user_raw[12:]
-            print("Bot:", paraphrase(text, llm), "\n")
+            print("Bot:", paraphrase(text, loaded().llm), "\n")
             continue
 
         # /hours
@@ -137,7 +408,7 @@ def main():
         # /unpack
         if cmd_low.startswith("/unpack "):
             desc = user_raw[8:]
-            print("Bot:", unpack_assignment(desc, llm), "\n")
+            print("Bot:", unpack_assignment(desc, loaded().llm), "\n")
             continue
 
         # /resources
@@ -147,30 +418,21 @@ def main():
             continue
 
         # /upload
-        m = re.match(r"/upload\s+(.+\.docx)", user_raw, re.I)
+        m = re.match(r"/upload\s+(.+)", user_raw, re.I)
         if m:
-            path = os.path.expanduser(m.group(1))
-            if not os.path.isfile(path):
-                print("Bot: File not found.\n")
-                continue
-            offenders = doc_missing_citations(path)
-            if offenders:
-                print("Bot: Possible uncited quotes:")
-                for q in offenders:
-                    print(" •", q)
-                print()
-            else:
-                print("Bot: No obvious uncited quotes.\n")
+            print("Bot:", citation_audit(m.group(1)), "\n")
             continue
 
         # default retrieval
-        lang = language_detect_and_prompt(user_raw)
-        result = qa({"query": user_raw})["result"]
+        with trace("chat"):
+            qa = loaded().qa
+            with span("language"):
+                lang = language_detect_and_prompt(user_raw)
+            result = qa.ask(user_raw, lang)
         club = peer_language_fallback(lang)
         if club:
             result += f"\n\n🔗 You might also connect with a cultural club: {club}"
         print("Bot:", result, "\n")
-        return result
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,110 @@
+# ollama_session.py
+"""
+Multi-turn chat with a long, fixed system prompt, straight on the Ollama
+client so the KV state can be carried between turns.
+
+The first turn sends the system prompt (always the same bytes, so Ollama's
+prompt cache can match it) plus the stored history. Ollama returns the
+token `context` of the whole exchange, and later turns send only the new
+message on top of it, so their prefill scales with the message, not with
+the system prompt. keep_alive keeps the model and its cache loaded between
+turns. Once the carried context passes `max_context` tokens the session
+starts over from the system prompt and the (bounded) memory. A turn that
+carried retrieved excerpts starts over too, so they don't ride along in the
+context for the rest of the session. Memory is only read on those
+rebuilds, so its summary is only folded then.
+"""
+
+from time import perf_counter
+
+import ollama
+
+from chat_memory import TokenBudgetMemory
+from llm_scheduler import INTERACTIVE, get_scheduler
+from telemetry import observe_stage, record
+
+OLLAMA_MODEL = "llama3"
+NUM_CTX = 32768
+KEEP_ALIVE = "30m"          # how long Ollama keeps the model loaded after a call
+CONTEXT_TOKENS = 8192       # carried context at which the session is rebuilt from memory
+
+
+def preload_model(model: str = OLLAMA_MODEL, client: ollama.Client = None) -> bool:
+    """
+    Have Ollama load `model` now (an empty prompt only loads it), so the
+    first real turn doesn't pay for it. False if Ollama isn't reachable.
+    """
+    try:
+        (client or ollama.Client()).generate(model=model, prompt="", keep_alive=KEEP_ALIVE)
+    except Exception:
+        return False
+    return True
+
+
+def record_timings(part, start: float, first: float) -> None:
+    """Ollama's own prefill/decode figures from the final part of a generate() stream."""
+    if part.prompt_eval_duration:
+        observe_stage("prefill", part.prompt_eval_duration / 1e9)
+    if part.eval_duration:
+        observe_stage("decode", part.eval_duration / 1e9)
+    if part.load_duration:
+        observe_stage("model_load", part.load_duration / 1e9)
+    observe_stage("generate", perf_counter() - start)
+    record(prompt_tokens=part.prompt_eval_count or 0, tokens=part.eval_count or 0)
+    if first is not None:
+        record(ttft_s=round(first - start, 6))
+    if part.eval_count and part.eval_duration:
+        record(tokens_per_s=round(part.eval_count / (part.eval_duration / 1e9), 2))
+
+
+class OllamaSession:
+    def __init__(self, system: str, memory: TokenBudgetMemory, model: str = OLLAMA_MODEL,
+                 client: ollama.Client = None, max_context: int = CONTEXT_TOKENS):
+        self.system = system.strip()
+        self.memory = memory
+        # read only when the context is rebuilt: fold the summary then, not after every turn
+        self.memory.background = False
+        self.model = model
+        self.client = client or ollama.Client()
+        self.max_context = max_context
+        self.context = None     # Ollama token context after the last complete turn
+
+    def _request(self, message: str) -> dict:
+        if self.context is not None and len(self.context) <= self.max_context:
+            # the system prompt and history are already in `context`; an
+            # empty system keeps Ollama from templating it in a second time
+            return {"prompt": message, "context": self.context, "system": ""}
+        history = self.memory.load_memory_variables({})[self.memory.memory_key]
+        prompt = f"{history}\nHuman: {message}" if history else message
+        return {"prompt": prompt, "system": self.system}
+
+    def stream(self, message: str, excerpts: str = ""):
+        """
+        Yields the reply as it is generated. `excerpts` (retrieved text) is
+        sent with this turn only; memory keeps just the message, and the
+        context returned for such a turn is dropped. Context and memory are
+        only updated for a complete reply; closing the generator early
+        leaves the session as it was.
+        """
+        text = f"Relevant excerpts:\n{excerpts}\n\n{message}" if excerpts else message
+        parts, context = [], None
+        # before taking a slot: a rebuild may fold the memory summary, which needs one too
+        request = self._request(text)
+        with get_scheduler().slot(INTERACTIVE):
+            start, first = perf_counter(), None
+            for part in self.client.generate(model=self.model, stream=True, keep_alive=KEEP_ALIVE,
+                                             options={"num_ctx": NUM_CTX}, **request):
+                if part.response:
+                    if first is None:
+                        first = perf_counter()
+                    parts.append(part.response)
+                    yield part.response
+                if part.done:
+                    context = part.context
+                    record_timings(part, start, first)
+        self.context = None if excerpts else context
+        self.memory.save_context({"input": message}, {"text": "".join(parts)})
+
+    def reset(self) -> None:
+        self.context = None
+        self.memory.clear()
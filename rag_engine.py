@@ -1,17 +1,28 @@
 # rag_engine.py
 
+import json
 import os
+import shutil
+import threading
+import time
 from langchain_community.llms import Ollama
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from web_scraper import get_all_documents
-from langchain.memory import ConversationBufferMemory          # NEW
-from langchain.chains import ConversationalRetrievalChain      # NEW
+from ingest import ingest
+from vector_store import VectorStore, DEFAULT_SPEC
+from embeddings import get_embedding_service
+from chat_memory import TokenBudgetMemory, count_tokens
+from langchain_core.messages import get_buffer_string
+from answer_cache import AnswerCache
+from language import detect_language, get_detector
+from llm_scheduler import ScheduledLLM
+from ollama_session import OLLAMA_MODEL, NUM_CTX, KEEP_ALIVE
+from telemetry import cache_lookup, record, span, timed_stream, trace
 
-INDEX_PATH = "faiss_index"
+INDEX_PATH = "faiss_index"     # holds v<ns>/ version directories and CURRENT
+CURRENT_FILE = "CURRENT"
+INDEX_SPEC = DEFAULT_SPEC      # flat | ivf | hnsw | ivfpq | sq8 | sqfp16 (vector_store.INDEX_SPECS)
+RETRIEVAL_MODE = "hybrid"      # dense | bm25 | hybrid (vector_store.RETRIEVAL_MODES)
+MANIFEST_FILE = "manifest.json"
 
 QA_TEMPLATE = """You are ASU Writing Support Bot.
 Answer the question using the provided context. 
@@ -24,43 +35,293 @@ Question:
 {question}
 """
 
-def rebuild_vectorstore(embeddings):
-    raw_docs = get_all_documents()
-    splitter = CharacterTextSplitter(chunk_size=400, chunk_overlap=50)
-    docs = splitter.create_documents(raw_docs)
-    vs = FAISS.from_documents(docs, embeddings)
-    vs.save_local(INDEX_PATH)
+CONDENSE_TEMPLATE = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language.
+
+Chat History:
+{chat_history}
+Follow Up Input: {question}
+Standalone question:"""
+
+def load_manifest(path: str = INDEX_PATH) -> dict:
+    """{"pages": {url: {"sha1": page hash, "chunks": [chunk ids]}}}"""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"pages": {}}
+
+
+def save_manifest(manifest: dict, path: str = INDEX_PATH) -> None:
+    tmp = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, MANIFEST_FILE))
+
+
+def current_version(root: str = INDEX_PATH):
+    """Directory of the published index version, or None."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            version = os.path.join(root, f.read().strip())
+    except OSError:
+        return None
+    return version if os.path.isdir(version) else None
+
+
+def build_index(embeddings, full: bool = False, root: str = INDEX_PATH,
+                spec: str = INDEX_SPEC, **ingest_opts) -> str:
+    """
+    Build a new index version in a fresh `<root>/v<ns>` directory, starting
+    from a copy of the published version unless `full`. Only new or changed
+    chunks are embedded (see ingest.ingest, which also takes the batch size
+    and worker counts as `ingest_opts`); switching `spec` retrains from the
+    embedding cache. The published version is only read, so it keeps
+    serving while this runs. Returns the new directory.
+    """
+    base = None if full else current_version(root)
+    manifest = load_manifest(base) if base else {"pages": {}}
+    version_dir = os.path.join(root, f"v{time.time_ns()}")
+
+    vs = VectorStore.create(version_dir, embeddings, base, spec)
+    try:
+        ingest(vs, embeddings, manifest, **ingest_opts)
+        if not len(vs):
+            raise RuntimeError("No documents could be fetched to build the index.")
+        vs.save()
+        save_manifest(manifest, version_dir)
+    except BaseException:
+        vs.close()
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    vs.close()
+    return version_dir
+
+
+def publish_index(version_dir: str, root: str = INDEX_PATH) -> None:
+    """
+    Point CURRENT at a finished version with one atomic rename. The version
+    it replaces is kept for processes that haven't swapped yet; older ones
+    are deleted. On POSIX a process still reading one keeps its open and
+    mapped files until it closes them; where the OS refuses to delete open
+    files (Windows), the removal fails quietly and is retried on the next
+    publish.
+    """
+    previous = current_version(root)
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+    keep = {os.path.basename(version_dir), os.path.basename(previous or "")}
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith("v") and name not in keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def rebuild_vectorstore(embeddings, full: bool = False, spec: str = INDEX_SPEC, **ingest_opts):
+    """
+    Refresh the index on disk and return the new published version. Unless
+    `full` (or nothing is published yet), only new or changed chunks are
+    embedded.
+    """
+    version_dir = build_index(embeddings, full=full, spec=spec, **ingest_opts)
+    publish_index(version_dir)
+    return VectorStore.load(version_dir, embeddings)
+
+
+def load_vectorstore(embeddings, spec: str = INDEX_SPEC):
+    version_dir = current_version()
+    if version_dir is None:
+        return rebuild_vectorstore(embeddings, spec=spec)
+    vs = VectorStore.load(version_dir, embeddings)
+    if vs.spec != spec:
+        vs.close()
+        return rebuild_vectorstore(embeddings, spec=spec)
     return vs
 
-def setup_rag(refresh: bool = False):
-    llm = Ollama(model="llama3", num_ctx=32768 )
-
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    )
-
-    if refresh or not os.path.exists(INDEX_PATH):
-        vectorstore = rebuild_vectorstore(embeddings)
-    else:
-        vectorstore = FAISS.load_local(
-            INDEX_PATH,
-            embeddings,
-            allow_dangerous_deserialization=True
-        )
-
-    prompt = PromptTemplate(
-        template=QA_TEMPLATE,
-        input_variables=["context", "question"]
-    )
-    
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        return_messages=True            # returns a list[dict(role,content)]
-    )
-
-    qa_chain = ConversationalRetrievalChain.from_llm(     # CHANGED
-        llm=llm,
-        retriever=vectorstore.as_retriever(),
-        memory=memory,
-    )
-    return qa_chain, llm
+class RagChain:
+    """
+    Conversational retrieval, step by step: condense the follow-up into a
+    standalone question, answer from the semantic cache if a near-duplicate
+    was already answered, otherwise retrieve and generate. Same steps as
+    LangChain's ConversationalRetrievalChain, spelled out so the cache can
+    sit between condensing and retrieval.
+    """
+
+    def __init__(self, llm, retriever, memory, answer_cache: AnswerCache = None,
+                 session_index=None):
+        self.llm = llm
+        self.retriever = retriever
+        self.memory = memory
+        self.answer_cache = answer_cache
+        self.session_index = session_index  # session_index.SessionIndex of the user's files
+        self.qa_prompt = PromptTemplate.from_template(QA_TEMPLATE)
+        self.condense_prompt = PromptTemplate.from_template(CONDENSE_TEMPLATE)
+
+    def condense(self, question: str) -> str:
+        history = self.memory.load_memory_variables({})["chat_history"]
+        if not history:
+            return question
+        with span("condense"):
+            return self.llm.invoke(self.condense_prompt.format(
+                chat_history=get_buffer_string(history), question=question
+            )).strip()
+
+    def has_files(self) -> bool:
+        return self.session_index is not None and len(self.session_index) > 0
+
+    def retrieve(self, question: str) -> list:
+        """Shared-index hits, preceded by the best matches from the user's own files."""
+        with span("retrieve"):
+            docs = self.retriever.invoke(question)
+            if self.has_files():
+                docs = [d for d, _ in self.session_index.search(question)] + docs
+        record(chunks=len(docs))
+        return docs
+
+    def ask_stream(self, question: str, lang: str = "en"):
+        """
+        Yields the answer as the LLM produces it. Memory and the answer cache
+        are only updated once the whole answer has been produced, so closing
+        the generator early (a cancelled turn) leaves no half answer behind.
+        """
+        standalone = self.condense(question)
+        # answers drawing on a user's own files never go through the shared cache
+        cache = None if self.has_files() else self.answer_cache
+        answer = None
+        if cache:
+            # read before retrieving: if the index is swapped meanwhile, the answer isn't cached
+            generation = cache.generation
+            with span("answer_cache"):
+                answer = cache.lookup(standalone, lang)
+            cache_lookup("answer", answer is not None)
+        if answer is not None:
+            yield answer
+        else:
+            docs = self.retrieve(standalone)
+            context = "\n\n".join(d.page_content for d in docs)
+            prompt = self.qa_prompt.format(context=context, question=standalone)
+            record(prompt_tokens=count_tokens(prompt))
+            parts = []
+            for chunk in timed_stream(self.llm.stream(prompt)):
+                parts.append(chunk)
+                yield chunk
+            answer = "".join(parts)
+            if cache:
+                cache.store(standalone, lang, answer, generation)
+        self.memory.save_context({"question": question}, {"answer": answer})
+
+    def ask(self, question: str, lang: str = "en") -> str:
+        return "".join(self.ask_stream(question, lang))
+
+    def __call__(self, inputs: dict) -> dict:
+        # legacy callers don't pass a language; the answer cache is keyed by it
+        lang = inputs.get("lang") or detect_language(inputs["question"])
+        return {"answer": self.ask(inputs["question"], lang)}
+
+
+class SharedRag:
+    """
+    Everything a conversation doesn't own: the LLM client, the embedding
+    model, the published index and the answer cache. One instance backs any
+    number of RagChains (one per chat session). It is also their retriever,
+    so a rebuilt index swapped in here reaches every session at once.
+    """
+
+    def __init__(self, refresh: bool = False, index_spec: str = INDEX_SPEC,
+                 retrieval_mode: str = RETRIEVAL_MODE, llm=None):
+        self.index_spec = index_spec
+        self.retrieval_mode = retrieval_mode
+        # every call queues on the process-wide LLM scheduler (interactive priority);
+        # `llm` replaces Ollama, e.g. with the fake in benchmarks/offline.py
+        llm = llm or Ollama(model=OLLAMA_MODEL, num_ctx=NUM_CTX, keep_alive=KEEP_ALIVE)
+        self.llm = ScheduledLLM(llm)
+
+        with trace("startup"):
+            # same model instance the router uses; vectors are unit-normalised
+            with span("load_embeddings"):
+                self.embeddings = get_embedding_service()
+            # load the langdetect profiles now rather than on the first message
+            with span("load_language_profiles"):
+                get_detector()
+
+            with span("load_index"):
+                if refresh:
+                    vectorstore = rebuild_vectorstore(self.embeddings, spec=index_spec)
+                else:
+                    vectorstore = load_vectorstore(self.embeddings, spec=index_spec)
+        self.retriever = vectorstore.as_retriever(mode=retrieval_mode)
+        self._readers = {}      # store -> retrievals running on it
+        self._retired = []      # swapped-out stores, closed once nothing reads them
+        self._stores_lock = threading.Lock()
+        self.answer_cache = AnswerCache(self.embeddings)
+        self._rebuild_thread = None
+        self._rebuild_lock = threading.Lock()
+        self.rebuild_status = ""
+
+    def invoke(self, query: str):
+        with self._stores_lock:
+            retriever = self.retriever
+            self._readers[retriever.store] = self._readers.get(retriever.store, 0) + 1
+        try:
+            return retriever.invoke(query)
+        finally:
+            with self._stores_lock:
+                self._readers[retriever.store] -= 1
+                if not self._readers[retriever.store]:
+                    del self._readers[retriever.store]
+                self._close_retired()
+
+    def swap(self, vectorstore) -> None:
+        # a turn in flight keeps the retriever it started with; the old store
+        # is closed (its connection and maps released) once that turn is done
+        with self._stores_lock:
+            self._retired.append(self.retriever.store)
+            self.retriever = vectorstore.as_retriever(mode=self.retrieval_mode)
+            self._close_retired()
+        self.answer_cache.clear()
+
+    def _close_retired(self) -> None:
+        for store in [s for s in self._retired if s not in self._readers]:
+            store.close()
+            self._retired.remove(store)
+
+    def rebuild(self) -> None:
+        """Rebuild and swap in the new index, blocking until it is done."""
+        with trace("rebuild"), span("rebuild_index"):
+            self.swap(rebuild_vectorstore(self.embeddings, spec=self.index_spec))
+
+    def start_rebuild(self) -> bool:
+        """
+        rebuild() on a background thread; answers keep coming from the
+        current index meanwhile. Returns False if a rebuild is already running.
+        """
+        with self._rebuild_lock:
+            if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+                return False
+            self.rebuild_status = "running"
+            self._rebuild_thread = threading.Thread(target=self._rebuild, daemon=True)
+            self._rebuild_thread.start()
+        return True
+
+    def _rebuild(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            self.rebuild_status = f"failed: {e}"
+            return
+        self.rebuild_status = "done"
+
+    def new_chain(self, session_index=None) -> RagChain:
+        """A chain with its own, empty conversation memory (and optionally the user's files)."""
+        # bounded: last few turns verbatim, older ones summarised
+        memory = TokenBudgetMemory(llm=self.llm, memory_key="chat_history")
+        return RagChain(llm=self.llm, retriever=self, memory=memory,
+                        answer_cache=self.answer_cache, session_index=session_index)
+
+
+def setup_rag(refresh: bool = False, index_spec: str = INDEX_SPEC,
+              retrieval_mode: str = RETRIEVAL_MODE, llm=None):
+    shared = SharedRag(refresh=refresh, index_spec=index_spec, retrieval_mode=retrieval_mode, llm=llm)
+    return shared.new_chain(), shared.llm
@@ -1,52 +1,96 @@
-from sentence_transformers import SentenceTransformer, util
+import threading
+
 import numpy as np
 
+from embeddings import EmbeddingService, get_embedding_service
+from telemetry import span
+
+
+DB_RESEARCH = ["Hey, I’m really lost—could you walk me through how to start writing an research paper?",
+               "I’ve never done this before—what’s the first step in putting together an paper?",
+               "Can you help me figure out how to format my references the way wants? I’m so confused!",
+               "I’m not sure what should go in each section of an paper. Could you explain what’s expected in the introduction and abstract?",
+               "English isn’t my first language, so I’m worried my writing on this research paper won’t sound academic enough. Can you help guide me make it better?",
+               "How do I organize my ideas so my paper flows the way papers are supposed to?",
+               "I keep getting stuck on how to write about my results. Can you show me how to do that in the style?",
+               "Is there an easy way to check if I’m following all the formatting rules? I don’t want to miss anything important.",
+               "please guide me through the process of writing an research paper",
+               "I am unsure how to summarize my research findings in the abstract and conclusion sections for journals."]  # db for research
+
+DB_RESUME = ["I need help creating my first resume for internships—what should I include as a freshman?",
+             "Can you show me how to list my high school achievements on a CV for university applications?",
+             "My English isn’t perfect, so I’m not sure how to describe my skills professionally on my resume. Can you help?",
+             "What’s the difference between a CV and a resume, and which one should I use for jobs in the US?",
+             "I don’t have much work experience yet—how can I make my resume stand out?",
+             "How should I format my contact information and education section on my CV?",
+             "Can you help me write a summary statement for my resume that sounds confident but not arrogant?",
+             "I’m confused about how to organize my extracurricular activities and volunteer work on my resume.",
+             "Is there a specific way to write about my language skills and certifications in a CV for international students?",
+             "Could you review my resume and suggest improvements so it looks more professional to employers?"]  # db for the resume
+
+ROUTES = {
+    "research": DB_RESEARCH,
+    "resume": DB_RESUME,
+}
+
+
+class Router:
+    """
+    Resident intent router: the exemplars are encoded once with the shared
+    embedding service, so routing adds no model of its own to the process and
+    a message the retriever sees in the same turn is only encoded once.
+
+    The old router averaged the cosine similarity against every exemplar of a
+    route. With unit-length vectors that mean is exactly the dot product with
+    the mean exemplar, so each route collapses to one centroid row and scoring
+    a message is a single (n, dim) @ (dim, routes) multiply.
+    """
+
+    def __init__(self, routes: dict = ROUTES, embedder: EmbeddingService = None):
+        self.embedder = embedder or get_embedding_service()
+        self.names = list(routes)
+
+        exemplars, labels = [], []
+        for i, name in enumerate(self.names):
+            exemplars.extend(routes[name])
+            labels.extend([i] * len(routes[name]))
+
+        # (n_exemplars, dim), row-normalised, C-contiguous float32
+        self.exemplars = np.ascontiguousarray(self.embedder.encode(exemplars))
+        self.labels = np.asarray(labels)
+
+        # (dim, n_routes): the mean of each route's unit exemplars
+        centroids = [self.exemplars[self.labels == i].mean(axis=0) for i in range(len(self.names))]
+        self.centroids_t = np.ascontiguousarray(np.stack(centroids).T)
+
+    def scores(self, texts: list[str]) -> np.ndarray:
+        """(len(texts), n_routes) mean-cosine scores."""
+        return self.embedder.encode_queries(texts) @ self.centroids_t
+
+    def route_many(self, texts: list[str]) -> list[str]:
+        if not texts:
+            return []
+        with span("route"):
+            best = self.scores(texts).argmax(axis=1)
+        return [self.names[i] for i in best]
+
+    def route(self, text: str) -> str:
+        return self.route_many([text])[0]
+
+
+_router = None
+_router_lock = threading.Lock()
+
 
-def routerdb():
-    db_research = ["Hey, I’m really lost—could you walk me through how to start writing an research paper?",
-                   "I’ve never done this before—what’s the first step in putting together an paper?",
-                   "Can you help me figure out how to format my references the way wants? I’m so confused!",
-                   "I’m not sure what should go in each section of an paper. Could you explain what’s expected in the introduction and abstract?",
-                   "English isn’t my first language, so I’m worried my writing on this research paper won’t sound academic enough. Can you help guide me make it better?",
-                   "How do I organize my ideas so my paper flows the way papers are supposed to?",
-                   "I keep getting stuck on how to write about my results. Can you show me how to do that in the style?",
-                   "Is there an easy way to check if I’m following all the formatting rules? I don’t want to miss anything important.",
-                   "please guide me through the process of writing an research paper",
-                   "I am unsure how to summarize my research findings in the abstract and conclusion sections for journals."]  # db for research
-
-    db_resume = ["I need help creating my first resume for internships—what should I include as a freshman?",
-                 "Can you show me how to list my high school achievements on a CV for university applications?",
-                 "My English isn’t perfect, so I’m not sure how to describe my skills professionally on my resume. Can you help?",
-                 "What’s the difference between a CV and a resume, and which one should I use for jobs in the US?",
-                 "I don’t have much work experience yet—how can I make my resume stand out?",
-                 "How should I format my contact information and education section on my CV?",
-                 "Can you help me write a summary statement for my resume that sounds confident but not arrogant?",
-                 "I’m confused about how to organize my extracurricular activities and volunteer work on my resume.",
-                 "Is there a specific way to write about my language skills and certifications in a CV for international students?",
-                 "Could you review my resume and suggest improvements so it looks more professional to employers?"]  # db for the resume
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')  # load the model once on start up
-
-    db_research_embeddings = model.encode(db_research)
-    db_resume_embeddings = model.encode(db_resume)
-
-    return db_research_embeddings, db_resume_embeddings, model
+def get_router() -> Router:
+    """Process-wide router, built on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = Router()
+    return _router
 
 
 def router_func(input):
-    model_name = ""
-    db_research_embeddings, db_resume_embeddings, model = routerdb()
-    input_embedding = model.encode([input])[0]  # encode the user input
-    similarities_research = util.cos_sim(input_embedding, db_research_embeddings)[
-        0].cpu().numpy()  # get the cosine matrix compare to the research db
-    similarities_resume = util.cos_sim(input_embedding, db_resume_embeddings)[
-        0].cpu().numpy()  # get the cosine matrix compare to the resume db
-
-    average_similarity_research = np.mean(similarities_research)  # get the avg score
-    average_similarity_resume = np.mean(similarities_resume)
-
-    if average_similarity_research > average_similarity_resume:
-        model_name = "research"
-    else:
-        model_name = "resume"
-
-    return model_name
\ No newline at end of file
+    return get_router().route(input)
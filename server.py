@@ -0,0 +1,388 @@
+# server.py
+"""
+HTTP/WebSocket chat service for many users on one box.
+
+One SharedRag (LLM client, embedding model, index, answer cache) is loaded
+at start-up; every session gets its own ChatEngine on top of it, so the
+conversation memory is per session and everything heavy is shared.
+
+    python server.py [--host 0.0.0.0] [--port 8080] [--refresh] [--admin-token T]
+
+  POST   /sessions                  → 201 {"session": id}
+  DELETE /sessions/{id}
+  POST   /sessions/{id}/messages    {"message": ...}; the reply is streamed
+                                    back as chunked text/plain
+  GET    /sessions/{id}/ws          WebSocket: send each message as a text
+                                    frame, receive {"type": "token", "text": ...}
+                                    frames and then {"type": "done"}
+  GET    /health                    sessions, turns and LLM queue depth
+  GET    /metrics                   Prometheus text: per-stage latency, TTFT,
+                                    tokens/s, cache hit rates (telemetry.py)
+  POST   /admin/rebuild             rebuild the index in the background; only
+                                    with --admin-token, sent as a Bearer token
+
+Chat users can't rebuild the shared index (`refresh` is refused) or read
+files on this machine.
+
+Replies come from ChatEngine.respond_stream running on a worker thread. At
+most MAX_ACTIVE_TURNS generate at once and MAX_QUEUED_TURNS wait for a
+slot; beyond that a turn is refused with 503. A session runs one turn at a
+time (409 otherwise). Each turn hands its pieces to the client through a
+queue of STREAM_BUFFER entries, so a slow reader pauses its own generation
+instead of buffering the reply in memory.
+"""
+
+import argparse
+import asyncio
+import hmac
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import WSMsgType, web
+
+from llm_scheduler import get_scheduler
+from main import ChatEngine
+from rag_engine import SharedRag, INDEX_SPEC, RETRIEVAL_MODE
+from telemetry import TRACE_FILE, render_metrics, set_trace_file
+
+MAX_SESSIONS = 200
+MAX_ACTIVE_TURNS = 4        # replies generated concurrently
+MAX_QUEUED_TURNS = 32       # turns waiting for a slot before we answer 503
+STREAM_BUFFER = 16          # pieces buffered per turn before generation pauses
+SESSION_TTL = 30 * 60       # idle seconds before a session is dropped
+EXPIRE_EVERY = 60
+
+_DONE = object()
+
+
+class Busy(Exception):
+    """The server can't take another session or turn right now (503)."""
+
+
+class TurnInProgress(Exception):
+    """The session is still producing its previous reply (409)."""
+
+
+class TurnFailed(Exception):
+    """The engine raised while producing a reply."""
+
+
+class Session:
+    def __init__(self, engine: ChatEngine):
+        self.engine = engine
+        self.busy = False
+        self.last_used = time.monotonic()
+
+
+class Turn:
+    """
+    One reply in flight. Iterate it (async) for the pieces; close() abandons
+    it, after which the worker thread stops at its next piece.
+    """
+
+    def __init__(self, loop, buffer: int):
+        self._loop = loop
+        self._pieces = asyncio.Queue(buffer)
+        self.stopped = threading.Event()
+
+    def put(self, item) -> None:
+        """Worker-thread side; blocks while the client is behind."""
+        asyncio.run_coroutine_threadsafe(self._pieces.put(item), self._loop).result()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        item = await self._pieces.get()
+        if item is _DONE:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise TurnFailed(str(item)) from item
+        return item
+
+    def close(self) -> None:
+        self.stopped.set()
+        # unblock a worker waiting in put(); it checks `stopped` before the next one
+        while not self._pieces.empty():
+            self._pieces.get_nowait()
+
+
+class ChatService:
+    def __init__(self, shared: SharedRag, max_sessions: int = MAX_SESSIONS,
+                 max_active: int = MAX_ACTIVE_TURNS, max_queued: int = MAX_QUEUED_TURNS,
+                 buffer: int = STREAM_BUFFER, ttl: float = SESSION_TTL):
+        self.shared = shared
+        self.sessions = {}
+        self.max_sessions = max_sessions
+        self.max_queued = max_queued
+        self.buffer = buffer
+        self.ttl = ttl
+        self.active = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(max_active)
+        self._pool = ThreadPoolExecutor(max_active, thread_name_prefix="turn")
+
+    # ── sessions ──
+    def create_session(self) -> str:
+        if len(self.sessions) >= self.max_sessions:
+            self.expire()
+            if len(self.sessions) >= self.max_sessions:
+                raise Busy("too many open sessions")
+        sid = uuid.uuid4().hex
+        # remote users must not read files on this machine (/upload, /bib <path>)
+        # nor start a full re-scrape and re-embed for everyone (refresh)
+        self.sessions[sid] = Session(ChatEngine(shared=self.shared, local_files=False,
+                                                allow_refresh=False))
+        return sid
+
+    def close_session(self, sid: str) -> bool:
+        session = self.sessions.pop(sid, None)
+        if session is None:
+            return False
+        session.engine.close()
+        return True
+
+    def expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        for sid in [s for s, v in self.sessions.items() if not v.busy and v.last_used < cutoff]:
+            self.close_session(sid)
+
+    # ── turns ──
+    async def start_turn(self, sid: str, message: str) -> Turn:
+        """
+        Wait for a generation slot and start producing the reply to
+        `message`. Raises KeyError for an unknown session, TurnInProgress or
+        Busy if the turn can't be taken.
+        """
+        session = self.sessions[sid]
+        if session.busy:
+            raise TurnInProgress("a reply is already streaming in this session")
+        if self.queued >= self.max_queued:
+            raise Busy("server busy, try again shortly")
+        session.busy = True
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            session.busy = False
+            raise
+        finally:
+            self.queued -= 1
+        self.active += 1
+
+        loop = asyncio.get_running_loop()
+        turn = Turn(loop, self.buffer)
+
+        def produce():
+            stream = session.engine.respond_stream(message)
+            try:
+                for piece in stream:
+                    if turn.stopped.is_set():
+                        return
+                    turn.put(piece)
+                if not turn.stopped.is_set():
+                    turn.put(_DONE)
+            except Exception as e:
+                if not turn.stopped.is_set():
+                    turn.put(e)
+            finally:
+                stream.close()
+
+        def finished(_):
+            # the slot and the session stay taken until the thread is really done
+            self.active -= 1
+            self._slots.release()
+            session.busy = False
+            session.last_used = time.monotonic()
+
+        loop.run_in_executor(self._pool, produce).add_done_callback(finished)
+        return turn
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+SERVICE = web.AppKey("service", ChatService)
+ADMIN_TOKEN = web.AppKey("admin_token", str)
+
+
+def _session_id(request: web.Request) -> str:
+    sid = request.match_info["sid"]
+    if sid not in request.app[SERVICE].sessions:
+        raise web.HTTPNotFound(text="unknown session")
+    return sid
+
+
+async def _start(service: ChatService, sid: str, message: str) -> Turn:
+    try:
+        return await service.start_turn(sid, message)
+    except KeyError:
+        raise web.HTTPNotFound(text="unknown session")
+    except TurnInProgress as e:
+        raise web.HTTPConflict(text=str(e))
+    except Busy as e:
+        raise web.HTTPServiceUnavailable(text=str(e), headers={"Retry-After": "5"})
+
+
+async def create_session(request: web.Request) -> web.Response:
+    try:
+        sid = request.app[SERVICE].create_session()
+    except Busy as e:
+        raise web.HTTPServiceUnavailable(text=str(e))
+    return web.json_response({"session": sid}, status=201)
+
+
+async def delete_session(request: web.Request) -> web.Response:
+    request.app[SERVICE].close_session(_session_id(request))
+    return web.Response(status=204)
+
+
+async def post_message(request: web.Request) -> web.StreamResponse:
+    sid = _session_id(request)
+    try:
+        message = str((await request.json())["message"]).strip()
+    except (ValueError, KeyError, TypeError):
+        raise web.HTTPBadRequest(text='expected a JSON body {"message": "..."}')
+    if not message:
+        raise web.HTTPBadRequest(text="empty message")
+
+    turn = await _start(request.app[SERVICE], sid, message)
+    try:
+        resp = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+        resp.enable_chunked_encoding()
+        await resp.prepare(request)
+        try:
+            async for piece in turn:
+                # write() waits for the socket to drain: backpressure reaches the worker
+                await resp.write(piece.encode("utf-8"))
+        except TurnFailed as e:
+            await resp.write(f"\n\n⚠️ Error: {e}".encode("utf-8"))
+        await resp.write_eof()
+        return resp
+    finally:
+        turn.close()
+
+
+async def websocket(request: web.Request) -> web.WebSocketResponse:
+    service = request.app[SERVICE]
+    sid = _session_id(request)
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            continue
+        message = msg.data.strip()
+        if not message:
+            continue
+        try:
+            turn = await service.start_turn(sid, message)
+        except KeyError:
+            await ws.send_json({"type": "error", "error": "unknown session"})
+            break
+        except (TurnInProgress, Busy) as e:
+            await ws.send_json({"type": "error", "error": str(e)})
+            continue
+        try:
+            async for piece in turn:
+                await ws.send_json({"type": "token", "text": piece})
+            await ws.send_json({"type": "done"})
+        except TurnFailed as e:
+            await ws.send_json({"type": "error", "error": str(e)})
+        finally:
+            turn.close()
+    return ws
+
+
+async def health(request: web.Request) -> web.Response:
+    service = request.app[SERVICE]
+    return web.json_response({
+        "sessions": len(service.sessions),
+        "active_turns": service.active,
+        "queued_turns": service.queued,
+        "rebuild": service.shared.rebuild_status,
+        "llm": get_scheduler().metrics(),
+    })
+
+
+async def metrics(request: web.Request) -> web.Response:
+    service = request.app[SERVICE]
+    llm = get_scheduler().metrics()
+    text = render_metrics({
+        "chatbot_sessions": len(service.sessions),
+        "chatbot_active_turns": service.active,
+        "chatbot_queued_turns": service.queued,
+        "chatbot_llm_in_flight": llm["in_flight"],
+        "chatbot_llm_queued": sum(llm["queued"].values()),
+    })
+    return web.Response(text=text, content_type="text/plain")
+
+
+async def rebuild(request: web.Request) -> web.Response:
+    token = request.app[ADMIN_TOKEN]
+    sent = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(sent.encode("utf-8"), token.encode("utf-8")):
+        raise web.HTTPUnauthorized(text="admin token required")
+    shared = request.app[SERVICE].shared
+    if not shared.start_rebuild():
+        raise web.HTTPConflict(text="a rebuild is already running")
+    return web.json_response({"rebuild": shared.rebuild_status}, status=202)
+
+
+async def _expire_sessions(app: web.Application):
+    service = app[SERVICE]
+
+    async def run():
+        while True:
+            await asyncio.sleep(EXPIRE_EVERY)
+            service.expire()
+
+    task = asyncio.create_task(run())
+    yield
+    task.cancel()
+    service.close()
+
+
+def make_app(service: ChatService, admin_token: str = None) -> web.Application:
+    app = web.Application()
+    app[SERVICE] = service
+    app.cleanup_ctx.append(_expire_sessions)
+    app.add_routes([
+        web.post("/sessions", create_session),
+        web.delete("/sessions/{sid}", delete_session),
+        web.post("/sessions/{sid}/messages", post_message),
+        web.get("/sessions/{sid}/ws", websocket),
+        web.get("/health", health),
+        web.get("/metrics", metrics),
+    ])
+    if admin_token:
+        app[ADMIN_TOKEN] = admin_token
+        app.add_routes([web.post("/admin/rebuild", rebuild)])
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-session chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--refresh", action="store_true", help="rebuild the index before serving")
+    parser.add_argument("--index-spec", default=INDEX_SPEC)
+    parser.add_argument("--retrieval-mode", default=RETRIEVAL_MODE)
+    parser.add_argument("--max-active", type=int, default=MAX_ACTIVE_TURNS)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    parser.add_argument("--trace-file", default=TRACE_FILE, help="JSONL of per-request traces ('' to disable)")
+    parser.add_argument("--admin-token", help="enable POST /admin/rebuild for this Bearer token")
+    args = parser.parse_args(argv)
+
+    set_trace_file(args.trace_file or None)
+
+    shared = SharedRag(refresh=args.refresh, index_spec=args.index_spec,
+                       retrieval_mode=args.retrieval_mode)
+    service = ChatService(shared, max_sessions=args.max_sessions, max_active=args.max_active)
+    web.run_app(make_app(service, args.admin_token), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
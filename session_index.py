@@ -0,0 +1,106 @@
+# session_index.py
+"""
+Small in-memory vector index over the files one user attached to their
+session, queried next to the shared index.
+
+Files are split and embedded on a background thread a batch at a time, and
+every batch is searchable as soon as it is added, so a long draft never
+holds up the chat. Adding a file again only embeds the chunks that changed;
+removing one drops its vectors. Nothing is written to disk (the shared
+embedding cache is bypassed on purpose), and close() frees everything.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from citation_audit import iter_paragraphs
+from ingest import BATCH_SIZE, batched, split_page
+from telemetry import span
+from vector_store import faiss_id
+
+SESSION_K = 3   # chunks from the user's own files per question
+
+
+class SessionIndex:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(embeddings.dim))
+        self._chunks = {}       # path -> {chunk id: faiss id}
+        self._docs = {}         # faiss id -> Document
+        self._versions = {}     # path -> bumped on every add/remove, so stale jobs stop
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.index.ntotal
+
+    @property
+    def files(self) -> list[str]:
+        with self._lock:
+            return list(self._versions)
+
+    def add_file(self, path: str) -> Future:
+        """(Re)index `path` in the background; the future resolves when it's done."""
+        with self._lock:
+            version = self._versions[path] = self._versions.get(path, 0) + 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(1, thread_name_prefix="session-index")
+        return self._pool.submit(self._index, path, version)
+
+    def remove_file(self, path: str) -> None:
+        with self._lock:
+            self._versions.pop(path, None)
+            self._drop(list(self._chunks.pop(path, {}).values()))
+
+    def _drop(self, ids: list[int]) -> None:
+        if ids:
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+            for i in ids:
+                self._docs.pop(i, None)
+
+    def _index(self, path: str, version: int) -> None:
+        chunks = split_page(path, "\n\n".join(text for _, text in iter_paragraphs(path)))
+        with self._lock:
+            if self._versions.get(path) != version:
+                return
+            old = self._chunks.get(path, {})
+            self._drop([fid for cid, fid in old.items() if cid not in chunks])
+            self._chunks[path] = {cid: fid for cid, fid in old.items() if cid in chunks}
+            todo = [(cid, text) for cid, text in chunks.items() if cid not in old]
+
+        name = os.path.basename(path)
+        for batch in batched(todo, BATCH_SIZE):
+            vectors = self.embeddings.encode([text for _, text in batch])
+            ids = np.fromiter((faiss_id(cid) for cid, _ in batch), dtype=np.int64, count=len(batch))
+            with self._lock:
+                if self._versions.get(path) != version:
+                    return  # removed or re-added meanwhile
+                self.index.add_with_ids(vectors, ids)
+                for (cid, text), fid in zip(batch, ids.tolist()):
+                    self._chunks[path][cid] = fid
+                    self._docs[fid] = Document(page_content=text, metadata={"source": name}, id=cid)
+
+    def search(self, query: str, k: int = SESSION_K) -> list[tuple[Document, float]]:
+        if not len(self):
+            return []
+        q = self.embeddings.encode_query(query).reshape(1, -1)
+        with self._lock, span("session_search"):
+            scores, labels = self.index.search(q, k)
+            return [(self._docs[i], float(s)) for i, s in zip(labels[0].tolist(), scores[0]) if i in self._docs]
+
+    def close(self) -> None:
+        """Stop indexing and free all vectors and chunks."""
+        with self._lock:
+            self._versions.clear()
+            self._chunks.clear()
+            self._docs.clear()
+            self.index.reset()
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,323 @@
+# telemetry.py
+"""
+Per-request tracing and metrics, cheap enough to leave on.
+
+A turn runs inside a trace (`with trace("chat"):`). Code along the way wraps
+its stages in `span("retrieve")`, adds figures with `record(...)` and counts
+cache lookups with `cache_lookup(...)`. Nothing is passed around: the open
+trace lives in a ContextVar, and outside of one spans and cache lookups
+still feed the metrics, they just aren't grouped.
+
+  * Metrics are process-wide Prometheus histograms and counters;
+    render_metrics() returns them in the text exposition format (server.py
+    serves it at /metrics).
+  * Each finished trace becomes one JSON line in TRACE_FILE. Lines are
+    handed to a background thread, so a turn never waits on the disk; if
+    the writer falls TRACE_QUEUE lines behind, traces are dropped (and
+    counted) instead.
+
+A span is two perf_counter() calls and one uncontended lock.
+"""
+
+import atexit
+import json
+import queue
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+TRACE_FILE = "traces.jsonl"     # None: metrics only
+TRACE_QUEUE = 10000
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160)
+CHUNK_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 16)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple, label: str = None):
+        self.name, self.help, self.buckets, self.label = name, help, buckets, label
+        self._series = {}   # label value -> [count per bucket..., +Inf, sum]
+
+    def observe(self, value: float, label_value: str = None) -> None:
+        s = self._series.get(label_value)
+        if s is None:
+            s = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+        s[bisect_left(self.buckets, value)] += 1
+        s[-1] += value
+
+    def totals(self) -> dict:
+        """{label value: (count, sum)}"""
+        with _lock:
+            return {lv: (sum(s[:-1]), s[-1]) for lv, s in self._series.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for lv, s in sorted(self._series.items(), key=lambda kv: kv[0] or ""):
+            labels = f'{self.label}="{lv}",' if self.label else ""
+            total = 0
+            for le, n in zip(self.buckets + ("+Inf",), s):
+                total += n
+                lines.append(f'{self.name}_bucket{{{labels}le="{le}"}} {total}')
+            labels = f"{{{labels[:-1]}}}" if labels else ""
+            lines.append(f"{self.name}_sum{labels} {s[-1]:.6g}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}   # label values -> count
+
+    def inc(self, label_values: tuple = (), n: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + n
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for lv, n in sorted(self._values.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, lv))
+            lines.append(f"{self.name}{{{labels}}} {n:g}" if labels else f"{self.name} {n:g}")
+        return lines
+
+
+REQUESTS = Counter("chatbot_requests_total", "Finished traces.", ("kind", "status"))
+REQUEST_SECONDS = Histogram("chatbot_request_seconds", "Wall time of a whole request.", SECONDS_BUCKETS, "kind")
+STAGE_SECONDS = Histogram("chatbot_stage_seconds", "Wall time per stage.", SECONDS_BUCKETS, "stage")
+TTFT_SECONDS = Histogram("chatbot_ttft_seconds", "Time to the first generated token.", SECONDS_BUCKETS)
+TOKENS_PER_SECOND = Histogram("chatbot_tokens_per_second", "Decoding speed.", RATE_BUCKETS)
+PROMPT_TOKENS = Histogram("chatbot_prompt_tokens", "Tokens in the generation prompt.", TOKEN_BUCKETS)
+RETRIEVED_CHUNKS = Histogram("chatbot_retrieved_chunks", "Chunks put into the prompt.", CHUNK_BUCKETS)
+GENERATED_TOKENS = Counter("chatbot_generated_tokens_total", "Tokens generated.")
+CACHE_LOOKUPS = Counter("chatbot_cache_lookups_total", "Cache lookups.", ("cache", "result"))
+TRACES_DROPPED = Counter("chatbot_traces_dropped_total", "Traces not written because the writer fell behind.")
+
+# record() keys that also feed a histogram
+_RECORDED = {
+    "ttft_s": TTFT_SECONDS,
+    "tokens_per_s": TOKENS_PER_SECOND,
+    "prompt_tokens": PROMPT_TOKENS,
+    "chunks": RETRIEVED_CHUNKS,
+}
+_METRICS = (REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, TTFT_SECONDS, TOKENS_PER_SECOND,
+            PROMPT_TOKENS, RETRIEVED_CHUNKS, GENERATED_TOKENS, CACHE_LOOKUPS, TRACES_DROPPED)
+
+_lock = threading.Lock()
+_current = ContextVar("trace", default=None)
+
+
+class Trace:
+    __slots__ = ("kind", "ts", "start", "spans", "values", "caches", "status", "done")
+
+    def __init__(self, kind: str, values: dict):
+        self.kind = kind
+        self.ts = time.time()
+        self.start = perf_counter()
+        self.spans = {}     # stage -> seconds, summed over repeats
+        self.values = values
+        self.caches = {}    # cache -> [hits, lookups]
+        self.status = "ok"
+        self.done = False
+
+    def to_json(self, total: float) -> str:
+        out = {"ts": round(self.ts, 3), "kind": self.kind, "status": self.status,
+               "total_ms": round(total * 1000, 3),
+               "spans_ms": {k: round(v * 1000, 3) for k, v in self.spans.items()}}
+        out.update(self.values)
+        if self.caches:
+            out["cache"] = {k: {"hits": h, "lookups": n} for k, (h, n) in self.caches.items()}
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+def current():
+    """The open trace of this thread/task, or None."""
+    t = _current.get()
+    return t if t is not None and not t.done else None
+
+
+@contextmanager
+def trace(kind: str, **values):
+    """
+    Groups everything measured inside into one record. Nested calls join
+    the open trace. A generator closed early ends its trace as "cancelled".
+    """
+    if current() is not None:
+        yield current()
+        return
+    t = Trace(kind, values)
+    _current.set(t)
+    try:
+        yield t
+    except GeneratorExit:
+        t.status = "cancelled"
+        raise
+    except BaseException:
+        t.status = "error"
+        raise
+    finally:
+        # set, not reset: a generator may be finished from another context
+        _current.set(None)
+        _finish(t)
+
+
+class Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.name, perf_counter() - self.start)
+        return False
+
+
+def span(name: str) -> Span:
+    """`with span("retrieve"):` times one stage."""
+    return Span(name)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Record a stage measured some other way (e.g. timings reported by Ollama)."""
+    with _lock:
+        STAGE_SECONDS.observe(seconds, name)
+    t = current()
+    if t is not None:
+        t.spans[name] = t.spans.get(name, 0.0) + seconds
+
+
+def record(**values) -> None:
+    """Attach figures (ttft_s, tokens, prompt_tokens, chunks, ...) to the open trace."""
+    t = current()
+    if t is not None:
+        t.values.update(values)
+
+
+def cache_lookup(cache: str, hit: bool, n: int = 1) -> None:
+    with _lock:
+        CACHE_LOOKUPS.inc((cache, "hit" if hit else "miss"), n)
+    t = current()
+    if t is not None:
+        c = t.caches.setdefault(cache, [0, 0])
+        c[0] += n if hit else 0
+        c[1] += n
+
+
+def timed_stream(chunks):
+    """
+    Passes an LLM stream through, recording the "generate" stage, time to
+    first token and tokens/s (one streamed chunk counts as one token).
+    """
+    start = perf_counter()
+    first, n = None, 0
+    try:
+        for chunk in chunks:
+            if first is None:
+                first = perf_counter()
+                record(ttft_s=round(first - start, 6))
+            n += 1
+            yield chunk
+    finally:
+        end = perf_counter()
+        observe_stage("generate", end - start)
+        record(tokens=n)
+        if n > 1 and end > first:
+            record(tokens_per_s=round((n - 1) / (end - first), 2))
+
+
+def _finish(t: Trace) -> None:
+    t.done = True
+    total = perf_counter() - t.start
+    with _lock:
+        REQUESTS.inc((t.kind, t.status))
+        REQUEST_SECONDS.observe(total, t.kind)
+        for key, hist in _RECORDED.items():
+            value = t.values.get(key)
+            if isinstance(value, (int, float)):
+                hist.observe(value)
+        if isinstance(t.values.get("tokens"), int):
+            GENERATED_TOKENS.inc((), t.values["tokens"])
+    if _writer.path:
+        _writer.put(t.to_json(total))
+
+
+def render_metrics(gauges: dict = None) -> str:
+    """
+    Prometheus text format: everything above, a hit ratio per cache, and
+    `gauges` ({name: value}) from the caller.
+    """
+    with _lock:
+        lines = [line for m in _METRICS for line in m.render()]
+        lookups = {}
+        for (cache, result), n in CACHE_LOOKUPS._values.items():
+            hits, total = lookups.get(cache, (0, 0))
+            lookups[cache] = (hits + (n if result == "hit" else 0), total + n)
+    lines += ["# HELP chatbot_cache_hit_ratio Hits over lookups since start.",
+              "# TYPE chatbot_cache_hit_ratio gauge"]
+    lines += [f'chatbot_cache_hit_ratio{{cache="{c}"}} {h / n:.4f}' for c, (h, n) in sorted(lookups.items())]
+    for name, value in (gauges or {}).items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value:g}"]
+    return "\n".join(lines) + "\n"
+
+
+class _TraceWriter:
+    """Appends JSON lines to `path` from one background thread."""
+
+    def __init__(self, path: str = TRACE_FILE, maxsize: int = TRACE_QUEUE):
+        self.path = path
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def put(self, line: str) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            with _lock:
+                TRACES_DROPPED.inc()
+
+    def _run(self) -> None:
+        f, path = None, None
+        while True:
+            line = self._queue.get()
+            if line is None:
+                break
+            if path != self.path:
+                if f is not None:
+                    f.close()
+                path = self.path
+                f = open(path, "a", encoding="utf-8") if path else None
+            if f is not None:
+                f.write(line + "\n")
+                if self._queue.empty():
+                    f.flush()
+        if f is not None:
+            f.close()
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Write out what is queued (called at exit)."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_writer = _TraceWriter()
+atexit.register(_writer.close)
+
+
+def set_trace_file(path) -> None:
+    """Write traces to `path` from now on; None stops writing them."""
+    _writer.path = path
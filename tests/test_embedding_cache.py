@@ -0,0 +1,98 @@
+# tests/test_embedding_cache.py
+"""
+EmbeddingCache on disk: what survives an interrupted append, and two
+caches (two processes, say) sharing one directory.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from embedding_cache import KEY_BYTES, EmbeddingCache
+
+MODEL = "test-model"
+DIM = 4
+
+
+def vectors(*texts: str) -> np.ndarray:
+    return np.array([[len(t), i, 1.0, -1.0] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path)
+
+
+def files(root: str) -> tuple[str, str]:
+    d = os.path.join(root, MODEL)
+    return os.path.join(d, "vectors.f32"), os.path.join(d, "keys.bin")
+
+
+def test_rows_survive_reopening(root):
+    cache = EmbeddingCache(MODEL, DIM, root)
+    cache.put_many(["a", "bb"], vectors("a", "bb"))
+    reopened = EmbeddingCache.open(MODEL, root)
+    got, missing = reopened.get_many(["bb", "c", "a"])
+    assert missing == [1]
+    np.testing.assert_array_equal(got[[0, 2]], vectors("a", "bb")[[1, 0]])
+
+
+def test_other_model_dim_is_refused(root):
+    EmbeddingCache(MODEL, DIM, root)
+    with pytest.raises(ValueError):
+        EmbeddingCache(MODEL, DIM + 1, root)
+
+
+def test_orphaned_vectors_are_ignored_then_overwritten(root):
+    EmbeddingCache(MODEL, DIM, root).put_many(["a"], vectors("a"))
+    vectors_path, _ = files(root)
+    # a crash after the vectors were flushed but before their keys were written
+    with open(vectors_path, "ab") as f:
+        f.write(np.full((2, DIM), 9, dtype=np.float32).tobytes())
+
+    cache = EmbeddingCache(MODEL, DIM, root)
+    assert len(cache) == 1
+    cache.put_many(["b"], vectors("x", "b")[1:])
+    assert os.path.getsize(vectors_path) == 2 * 4 * DIM
+    got, missing = EmbeddingCache(MODEL, DIM, root).get_many(["a", "b"])
+    assert missing == []
+    np.testing.assert_array_equal(got, np.vstack([vectors("a"), vectors("x", "b")[1:]]))
+
+
+def test_torn_key_is_ignored(root):
+    EmbeddingCache(MODEL, DIM, root).put_many(["a"], vectors("a"))
+    _, keys_path = files(root)
+    with open(keys_path, "ab") as f:
+        f.write(EmbeddingCache.key("b")[:KEY_BYTES // 2])
+
+    cache = EmbeddingCache(MODEL, DIM, root)
+    assert len(cache) == 1
+    assert cache.get_many(["b"])[1] == [0]
+    cache.put_many(["b"], vectors("b"))
+    assert os.path.getsize(keys_path) == 2 * KEY_BYTES
+    assert EmbeddingCache(MODEL, DIM, root).get_many(["a", "b"])[1] == []
+
+
+def test_shared_directory_appends_do_not_clobber(root):
+    first = EmbeddingCache(MODEL, DIM, root)
+    second = EmbeddingCache(MODEL, DIM, root)
+    first.put_many(["a", "b"], vectors("a", "b"))
+    # second still thinks the files are empty; its rows must go after first's
+    second.put_many(["c", "a"], vectors("c", "a"))
+
+    reopened = EmbeddingCache(MODEL, DIM, root)
+    assert len(reopened) == 3
+    got, missing = reopened.get_many(["a", "b", "c"])
+    assert missing == []
+    np.testing.assert_array_equal(got[:2], vectors("a", "b"))
+    np.testing.assert_array_equal(got[2], vectors("c")[0])
+
+
+def test_lookup_sees_rows_another_cache_added(root):
+    reader = EmbeddingCache(MODEL, DIM, root)
+    assert reader.get_many(["a"])[1] == [0]
+    EmbeddingCache(MODEL, DIM, root).put_many(["a"], vectors("a"))
+    got, missing = reader.get_many(["a"])
+    assert missing == []
+    np.testing.assert_array_equal(got, vectors("a"))
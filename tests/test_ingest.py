@@ -0,0 +1,173 @@
+# tests/test_ingest.py
+"""
+Incremental index builds (rag_engine.build_index over ingest.ingest): which
+chunks get embedded, and what the new version and its manifest hold.
+"""
+
+import hashlib
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import ingest
+from rag_engine import build_index, load_manifest, publish_index
+from vector_store import VectorStore
+from web_scraper import Page, PageCache
+
+A = "https://example.edu/a"
+B = "https://example.edu/b"
+
+
+def paragraph(word: str) -> str:
+    # ~300 characters: one chunk per paragraph at CHUNK_SIZE 400
+    return " ".join([word] * 60)
+
+
+def html(*words: str) -> str:
+    return "<div>" + "\n\n".join(paragraph(w) for w in words) + "</div>"
+
+
+class FakeEmbeddings:
+    """Hash vectors; remembers every text it was asked to encode."""
+
+    dim = 16
+
+    def __init__(self):
+        self.encoded = []
+
+    def _vector(self, text: str) -> np.ndarray:
+        v = np.frombuffer(hashlib.sha256(text.encode()).digest()[:16], dtype=np.uint8).astype(np.float32) - 128
+        return v / np.linalg.norm(v)
+
+    def encode_documents(self, texts, batch_size=None):
+        self.encoded += texts
+        return np.stack([self._vector(t) for t in texts])
+
+    def encode_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def site(monkeypatch):
+    """{url: html} served by a fake fetch_page; a url mapped to None fails to fetch."""
+    pages = {}
+
+    def fetch_page(session, cache, url, parse=True):
+        if pages.get(url) is None:
+            return Page(url, cache.text(url), False, 0)
+        return Page(url, "", True, 200, pages[url], {})
+
+    monkeypatch.setattr(ingest, "fetch_page", fetch_page)
+    return pages
+
+
+@pytest.fixture
+def build(tmp_path):
+    root = str(tmp_path / "index")
+    cache = PageCache(str(tmp_path / "pages"))
+    embeddings = FakeEmbeddings()
+
+    def run(urls, full=False, **opts):
+        embeddings.encoded.clear()
+        version = build_index(embeddings, full=full, root=root, urls=urls, cache=cache, parse_workers=0, **opts)
+        publish_index(version, root)
+        return version
+
+    run.embeddings = embeddings
+    return run
+
+
+def stored(version: str) -> set:
+    vs = VectorStore.load(version, FakeEmbeddings())
+    try:
+        return {row[0] for row in vs.db.execute("SELECT text FROM chunks")}
+    finally:
+        vs.close()
+
+
+def test_first_build_indexes_every_page(site, build):
+    site.update({A: html("alpha", "beta"), B: html("gamma")})
+    version = build([A, B])
+    assert stored(version) == {paragraph(w) for w in ("alpha", "beta", "gamma")}
+    assert set(load_manifest(version)["pages"]) == {A, B}
+
+
+def test_changed_page_only_embeds_its_new_chunks(site, build):
+    site.update({A: html("alpha", "beta"), B: html("gamma")})
+    build([A, B])
+    site[A] = html("alpha", "delta")
+    version = build([A, B])
+    assert build.embeddings.encoded == [paragraph("delta")]
+    assert stored(version) == {paragraph(w) for w in ("alpha", "delta", "gamma")}
+
+
+def test_unchanged_pages_embed_nothing(site, build):
+    site.update({A: html("alpha"), B: html("gamma")})
+    first = build([A, B])
+    version = build([A, B])
+    assert build.embeddings.encoded == []
+    assert stored(version) == stored(first)
+
+
+def test_removed_url_drops_its_chunks(site, build):
+    site.update({A: html("alpha"), B: html("gamma", "epsilon")})
+    build([A, B])
+    version = build([A])
+    assert stored(version) == {paragraph("alpha")}
+    assert set(load_manifest(version)["pages"]) == {A}
+
+
+def test_failed_fetch_keeps_the_old_chunks(site, build):
+    site.update({A: html("alpha"), B: html("gamma")})
+    first = build([A, B])
+    site[B] = None
+    version = build([A, B])
+    assert build.embeddings.encoded == []
+    assert stored(version) == {paragraph("alpha"), paragraph("gamma")}
+    assert load_manifest(version)["pages"][B] == load_manifest(first)["pages"][B]
+
+
+def test_full_rebuild_starts_from_nothing(site, build):
+    site.update({A: html("alpha", "beta"), B: html("gamma")})
+    build([A, B])
+    site[A] = html("alpha")
+    version = build([A, B], full=True)
+    assert sorted(build.embeddings.encoded) == sorted([paragraph("alpha"), paragraph("gamma")])
+    assert stored(version) == {paragraph("alpha"), paragraph("gamma")}
+
+
+def test_nothing_fetched_is_an_error(site, build, tmp_path):
+    site.update({A: None})
+    with pytest.raises(RuntimeError):
+        build([A])
+    # the half-built version directory is removed
+    assert not [p for p in (tmp_path / "index").iterdir() if p.name.startswith("v")]
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_embed_threads_are_put_back(site, build, monkeypatch, fail):
+    # torch's thread count is process-wide: query-time embedding must get it back
+    threads = [8]
+    torch = types.SimpleNamespace(get_num_threads=lambda: threads[0],
+                                  set_num_threads=lambda n: threads.__setitem__(0, n))
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    seen = []
+    encode = FakeEmbeddings.encode_documents
+
+    def encode_documents(self, texts, batch_size=None):
+        seen.append(threads[0])
+        if fail:
+            raise ZeroDivisionError
+        return encode(self, texts, batch_size)
+
+    monkeypatch.setattr(FakeEmbeddings, "encode_documents", encode_documents)
+    site.update({A: html("alpha")})
+    if fail:
+        with pytest.raises(ZeroDivisionError):
+            build([A], embed_threads=2)
+    else:
+        build([A], embed_threads=2)
+    assert seen == [2]
+    assert threads == [8]
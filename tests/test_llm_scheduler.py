@@ -0,0 +1,167 @@
+# tests/test_llm_scheduler.py
+"""
+LLMScheduler: start order by priority, deadlines while queued and while
+streaming, and that an abandoned wait never holds up the queue.
+"""
+
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import BULK, INTERACTIVE, DeadlineExceeded, LLMScheduler, ScheduledLLM, scheduled
+
+
+def wait_for(predicate, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.005)
+
+
+def queued(scheduler) -> int:
+    return sum(scheduler.metrics()["queued"].values())
+
+
+class SlowLLM:
+    def __init__(self, chunks=5, delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+
+    def invoke(self, prompt, **kwargs):
+        return "".join(self.stream(prompt))
+
+    def stream(self, prompt, **kwargs):
+        for i in range(self.chunks):
+            time.sleep(self.delay)
+            yield str(i)
+
+
+def test_interactive_starts_before_bulk_fifo_within_a_class():
+    scheduler = LLMScheduler(max_in_flight=1)
+    order = []
+
+    def call(name, priority):
+        with scheduler.slot(priority):
+            order.append(name)
+
+    scheduler.acquire()
+    threads = []
+    for name, priority in [("bulk1", BULK), ("chat1", INTERACTIVE), ("bulk2", BULK), ("chat2", INTERACTIVE)]:
+        t = threading.Thread(target=call, args=(name, priority))
+        t.start()
+        threads.append(t)
+        wait_for(lambda: queued(scheduler) == len(threads))
+    scheduler.release()
+    for t in threads:
+        t.join(2)
+
+    assert order == ["chat1", "chat2", "bulk1", "bulk2"]
+    metrics = scheduler.metrics()
+    assert metrics["completed"] == {"interactive": 3, "bulk": 2}
+    assert metrics["in_flight"] == 0
+
+
+def test_two_freed_slots_start_two_waiters():
+    # both slots come free back to back; the second waiter may wake before
+    # the head, and must still be woken again once the head has taken its slot
+    for _ in range(50):
+        scheduler = LLMScheduler(max_in_flight=2)
+        scheduler.acquire()
+        scheduler.acquire()
+        started = [threading.Event(), threading.Event()]
+        done = threading.Event()
+
+        def call(i):
+            with scheduler.slot():
+                started[i].set()
+                done.wait(2)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(2)]
+        for t in threads:
+            t.start()
+            wait_for(lambda: queued(scheduler) == threads.index(t) + 1)
+        scheduler.release()
+        scheduler.release()
+        assert all(e.wait(1) for e in started)
+        done.set()
+        for t in threads:
+            t.join(2)
+
+
+def test_deadline_while_the_slot_is_held():
+    scheduler = LLMScheduler(max_in_flight=1)
+    scheduler.acquire()
+    with pytest.raises(DeadlineExceeded):
+        scheduler.acquire(BULK, deadline=time.monotonic() + 0.05)
+    metrics = scheduler.metrics()
+    assert metrics["expired"]["bulk"] == 1
+    assert metrics["queued"]["bulk"] == 0
+
+    # the expired ticket is skipped: the next caller gets the slot
+    scheduler.release()
+    with scheduler.slot(BULK, deadline=time.monotonic() + 1):
+        assert scheduler.metrics()["in_flight"] == 1
+
+
+def test_expired_head_does_not_block_the_calls_behind_it():
+    scheduler = LLMScheduler(max_in_flight=1)
+    scheduler.acquire()
+    started = threading.Event()
+
+    def behind():
+        with scheduler.slot(BULK):
+            started.set()
+
+    expired = []
+
+    def head():
+        try:
+            scheduler.acquire(INTERACTIVE, deadline=time.monotonic() + 0.1)
+        except DeadlineExceeded:
+            expired.append(True)
+
+    t_head = threading.Thread(target=head)
+    t_head.start()
+    wait_for(lambda: queued(scheduler) == 1)
+    t_behind = threading.Thread(target=behind)
+    t_behind.start()
+    wait_for(lambda: queued(scheduler) == 2)
+    t_head.join(2)
+    assert expired
+
+    scheduler.release()
+    assert started.wait(2)
+    t_behind.join(2)
+
+
+def test_stream_is_cut_at_its_deadline_and_frees_the_slot():
+    scheduler = LLMScheduler(max_in_flight=1)
+    llm = ScheduledLLM(SlowLLM(chunks=50, delay=0.02), scheduler, BULK, timeout=0.1)
+    got = []
+    with pytest.raises(DeadlineExceeded):
+        for chunk in llm.stream("prompt"):
+            got.append(chunk)
+    assert 0 < len(got) < 50
+    assert scheduler.metrics()["in_flight"] == 0
+    assert scheduler.metrics()["completed"]["bulk"] == 1
+
+
+def test_closing_a_stream_early_frees_the_slot():
+    scheduler = LLMScheduler(max_in_flight=1)
+    stream = ScheduledLLM(SlowLLM(), scheduler).stream("prompt")
+    next(stream)
+    assert scheduler.metrics()["in_flight"] == 1
+    stream.close()
+    assert scheduler.metrics()["in_flight"] == 0
+
+
+def test_scheduled_reprioritises_without_wrapping_twice():
+    scheduler = LLMScheduler(max_in_flight=1)
+    chat = ScheduledLLM(SlowLLM(), scheduler)
+    bulk = scheduled(chat, BULK, timeout=5)
+    assert bulk.llm is chat.llm
+    assert bulk.scheduler is scheduler
+    assert (bulk.priority, bulk.timeout) == (BULK, 5)
+    assert bulk.invoke("prompt") == "01234"
+    assert scheduler.metrics()["completed"] == {"interactive": 0, "bulk": 1}
@@ -0,0 +1,349 @@
+# vector_store.py
+"""
+On-disk vector index without pickle.
+
+Each index version is a directory holding
+
+  vectors.npy   flat: the unit vectors (inner product = cosine) as a raw
+  ids.npy       float32 matrix plus their ids, searched in place through
+                np.memmap, so opening costs the same at any corpus size and
+                every process reads the same page-cache pages
+  index.faiss   other specs: a faiss IndexIDMap2. faiss only memory-maps
+                IVF inverted lists (IO_FLAG_MMAP); hnsw, sq8 and sqfp16 are
+                read onto the heap in full
+  chunks.db     SQLite table of chunk text + metadata keyed by the faiss id;
+                rows are only read for the top-k hits of a query
+  spec.json     which index type this is (see INDEX_SPECS)
+  bm25.npz      lexical inverted index over the same chunks (see bm25.py)
+
+A published version is never modified again, which is why readers can open
+chunks.db as immutable and skip SQLite locking altogether.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from bm25 import BM25Index
+from telemetry import span
+
+FAISS_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+CHUNKS_FILE = "chunks.db"
+SPEC_FILE = "spec.json"
+
+# short names → faiss factory strings; {nlist}/{m}/{nbits} are sized from
+# the corpus at build time. Anything else is passed to index_factory as is.
+INDEX_SPECS = {
+    "flat": "Flat",                     # exact
+    "ivf": "IVF{nlist},Flat",
+    "hnsw": "HNSW32",
+    "ivfpq": "IVF{nlist},PQ{m}x{nbits}",
+    "sq8": "SQ8",                       # int8 scalar quantisation
+    "sqfp16": "SQfp16",                 # float16
+}
+DEFAULT_SPEC = "flat"
+NPROBE = 8          # IVF lists scanned per query
+EF_SEARCH = 64      # HNSW candidate list size
+
+RETRIEVAL_MODES = ("dense", "bm25", "hybrid")
+RRF_K = 60          # reciprocal rank fusion damping
+LEXICAL_MARGIN = 1.5  # top BM25 score over the runner-up that makes it decisive
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id       INTEGER PRIMARY KEY,   -- faiss id
+    cid      TEXT NOT NULL UNIQUE,  -- content hash used by the ingest manifest
+    text     TEXT NOT NULL,
+    metadata TEXT NOT NULL
+)
+"""
+
+
+def factory_string(spec: str, n: int, dim: int) -> str:
+    """Factory string for `spec`, with training sizes picked for `n` vectors."""
+    desc = INDEX_SPECS.get(spec, spec)
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))   # faiss wants >= 39 points per list
+    m = next(m for m in (dim // 8, dim // 4, dim // 2, dim) if m and dim % m == 0)
+    nbits = max(1, min(8, int(math.log2(max(n, 2)))))
+    return desc.format(nlist=nlist, m=m, nbits=nbits)
+
+
+def make_index(spec: str, vectors: np.ndarray, ids: np.ndarray):
+    """Build (and train, if the type needs it) an inner-product index."""
+    dim = vectors.shape[1]
+    index = faiss.index_factory(dim, "IDMap2," + factory_string(spec, len(vectors), dim),
+                                faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def tune_index(index, nprobe: int = NPROBE, ef_search: int = EF_SEARCH) -> None:
+    ps = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            ps.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # not this index type
+
+
+def _read_spec(path: str) -> dict:
+    try:
+        with open(os.path.join(path, SPEC_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"spec": DEFAULT_SPEC, "trained_on": 0}
+
+
+class MappedFlatIndex:
+    """
+    Exact inner-product search over a memory-mapped float32 matrix, with the
+    search() contract of a faiss index. The vectors stay in the page cache:
+    a query reads them once, nothing is copied onto the heap.
+    """
+
+    def __init__(self, vectors: np.ndarray, ids: np.ndarray):
+        self.vectors = vectors
+        self.ids = ids
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path: str) -> "MappedFlatIndex":
+        return cls(np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r"),
+                   np.load(os.path.join(path, IDS_FILE), mmap_mode="r"))
+
+    @staticmethod
+    def save(index, path: str) -> None:
+        """Write a faiss IndexIDMap2 over a flat index as vectors.npy + ids.npy."""
+        np.save(os.path.join(path, VECTORS_FILE), index.index.reconstruct_n(0, index.ntotal))
+        np.save(os.path.join(path, IDS_FILE), faiss.vector_to_array(index.id_map))
+
+    def to_faiss(self):
+        """Writable in-memory copy, for building the next version."""
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.vectors.shape[1]))
+        index.add_with_ids(np.ascontiguousarray(self.vectors), np.ascontiguousarray(self.ids))
+        return index
+
+    def search(self, queries: np.ndarray, k: int):
+        scores = queries @ self.vectors.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, 1), axis=1), 1)
+        return np.take_along_axis(scores, top, 1), np.asarray(self.ids)[top]
+
+
+def read_index(path: str, mmap: bool = True):
+    """The index of the version at `path`: mapped for flat, from index.faiss otherwise."""
+    if os.path.exists(os.path.join(path, VECTORS_FILE)):
+        index = MappedFlatIndex.load(path)
+        return index if mmap else index.to_faiss()
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(os.path.join(path, FAISS_FILE), flags)
+    tune_index(index)
+    return index
+
+
+def faiss_id(cid: str) -> int:
+    """63-bit faiss id from a hex chunk id."""
+    return int(cid[:16], 16) & 0x7FFF_FFFF_FFFF_FFFF
+
+
+class VectorStore:
+    def __init__(self, index, db: sqlite3.Connection, embeddings, path: str = None,
+                 spec: str = DEFAULT_SPEC):
+        self.index = index
+        self.db = db
+        self.embeddings = embeddings
+        self.path = path
+        self.spec = spec
+        self._reindex = False
+        self._trained_on = 0
+        self.bm25 = None
+        self._lock = threading.Lock()
+
+    # ── opening ──
+    @classmethod
+    def load(cls, path: str, embeddings, mmap: bool = True) -> "VectorStore":
+        """
+        Read-only view of a published version. For flat the cost doesn't
+        depend on corpus size; other specs read their faiss index here.
+        """
+        index = read_index(path, mmap)
+        db_uri = "file:" + os.path.abspath(os.path.join(path, CHUNKS_FILE)) + "?mode=ro&immutable=1"
+        db = sqlite3.connect(db_uri, uri=True, check_same_thread=False)
+        store = cls(index, db, embeddings, path, _read_spec(path)["spec"])
+        store.bm25 = BM25Index.load(path)
+        return store
+
+    @classmethod
+    def create(cls, path: str, embeddings, base: str = None, spec: str = DEFAULT_SPEC) -> "VectorStore":
+        """
+        Writable store in the (new) directory `path`, seeded with a copy of
+        the version at `base` if given. `base` itself is never touched.
+
+        The base index is updated in place when it is of the same type, the
+        type supports removal and the corpus hasn't doubled since it was
+        trained. Otherwise only the chunk table is maintained during the
+        build and save() trains a fresh index from the embedding cache.
+        """
+        os.makedirs(path, exist_ok=True)
+        db = sqlite3.connect(os.path.join(path, CHUNKS_FILE), check_same_thread=False)
+        index, trained = None, 0
+        if base:
+            src = sqlite3.connect(os.path.join(base, CHUNKS_FILE))
+            src.backup(db)
+            src.close()
+            meta = _read_spec(base)
+            if meta["spec"] == spec and spec != "hnsw":
+                index = read_index(base, mmap=False)
+                trained = meta.get("trained_on", 0)
+                if trained and index.ntotal > 2 * trained:
+                    index = None
+        elif spec == DEFAULT_SPEC:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(embeddings.dim))
+        db.execute(_SCHEMA)
+        store = cls(index, db, embeddings, path, spec)
+        store._reindex = index is None
+        store._trained_on = trained
+        return store
+
+    # ── writing ──
+    def add(self, cids: list[str], texts: list[str], metadatas: list[dict], vectors: np.ndarray) -> None:
+        ids = np.fromiter((faiss_id(c) for c in cids), dtype=np.int64, count=len(cids))
+        with self._lock:
+            if not self._reindex:
+                self.index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+            self.db.executemany(
+                "INSERT OR REPLACE INTO chunks (id, cid, text, metadata) VALUES (?, ?, ?, ?)",
+                [(int(i), c, t, json.dumps(m)) for i, c, t, m in zip(ids, cids, texts, metadatas)],
+            )
+
+    def delete(self, cids: list[str]) -> None:
+        ids = [faiss_id(c) for c in cids]
+        with self._lock:
+            if not self._reindex:
+                self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+            self.db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+
+    def save(self) -> None:
+        with self._lock:
+            self.db.commit()
+            if self._reindex:
+                rows = self.db.execute("SELECT id, text FROM chunks ORDER BY id").fetchall()
+                ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+                # every chunk went through encode_documents, so these are cache hits
+                vectors = self.embeddings.encode_documents([r[1] for r in rows])
+                self.index = make_index(self.spec, vectors, ids)
+                self._reindex = False
+                # flat needs no training, so it never has to be retrained
+                self._trained_on = len(rows) if self.spec != DEFAULT_SPEC else 0
+            if self.spec == DEFAULT_SPEC:
+                MappedFlatIndex.save(self.index, self.path)
+            else:
+                faiss.write_index(self.index, os.path.join(self.path, FAISS_FILE))
+            with open(os.path.join(self.path, SPEC_FILE), "w", encoding="utf-8") as f:
+                json.dump({"spec": self.spec, "trained_on": self._trained_on}, f)
+            # rebuilt from the chunk table every time: no embedding involved
+            self.bm25 = BM25Index.build(self.db.execute("SELECT id, text FROM chunks"))
+            self.bm25.save(self.path)
+
+    def close(self) -> None:
+        self.db.close()
+        self.index = None   # unmaps the vectors once no search holds them
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    # ── reading ──
+    def get_by_ids(self, ids: list[int]) -> dict:
+        """{faiss id: Document} for the ids that exist."""
+        if not ids:
+            return {}
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT id, cid, text, metadata FROM chunks WHERE id IN ({marks})", ids
+            ).fetchall()
+        return {r[0]: Document(page_content=r[2], metadata=json.loads(r[3]), id=r[1]) for r in rows}
+
+    def _with_docs(self, hits: list[tuple[int, float]]) -> list[tuple[Document, float]]:
+        docs = self.get_by_ids([i for i, _ in hits])
+        return [(docs[i], s) for i, s in hits if i in docs]
+
+    def search_ids(self, vector: np.ndarray, k: int = 4) -> list[tuple[int, float]]:
+        if self.index is None or not self.index.ntotal:
+            return []
+        with span("faiss_search"):
+            scores, labels = self.index.search(np.asarray(vector, dtype=np.float32).reshape(1, -1), k)
+        return [(int(i), float(s)) for i, s in zip(labels[0], scores[0]) if i != -1]
+
+    def search_by_vector(self, vector: np.ndarray, k: int = 4) -> list[tuple[Document, float]]:
+        return self._with_docs(self.search_ids(vector, k))
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        return self.search_by_vector(self.embeddings.encode_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4) -> list[Document]:
+        return [d for d, _ in self.similarity_search_with_score(query, k)]
+
+    def lexical_search(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        if self.bm25 is None:
+            return []
+        with span("bm25"):
+            hits, _ = self.bm25.search(query, k)
+        return self._with_docs(hits)
+
+    def hybrid_search(self, query: str, k: int = 4, fetch_k: int = None) -> list[Document]:
+        """
+        Reciprocal rank fusion of BM25 and dense hits. If the lexical result
+        is decisive (the top hit has every query term and clearly outscores
+        the runner-up) the dense side, and with it the embedding forward
+        pass, is skipped.
+        """
+        fetch_k = fetch_k or 4 * k
+        with span("bm25"):
+            lex, all_terms = self.bm25.search(query, fetch_k) if self.bm25 is not None else ([], False)
+        if lex and all_terms and (len(lex) == 1 or lex[0][1] >= LEXICAL_MARGIN * lex[1][1]):
+            return [d for d, _ in self._with_docs(lex[:k])]
+
+        dense = self.search_ids(self.embeddings.encode_query(query), fetch_k)
+        fused = {}
+        for hits in (lex, dense):
+            for rank, (i, _) in enumerate(hits):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + rank + 1)
+        best = sorted(fused.items(), key=lambda kv: -kv[1])[:k]
+        return [d for d, _ in self._with_docs(best)]
+
+    def as_retriever(self, k: int = 4, mode: str = "dense") -> "VectorRetriever":
+        """`mode` is one of RETRIEVAL_MODES."""
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+        return VectorRetriever(store=self, k=k, mode=mode)
+
+
+class VectorRetriever(BaseRetriever):
+    store: object
+    k: int = 4
+    mode: str = "dense"
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        if self.mode == "hybrid":
+            return self.store.hybrid_search(query, self.k)
+        if self.mode == "bm25":
+            return [d for d, _ in self.store.lexical_search(query, self.k)]
+        return self.store.similarity_search(query, self.k)
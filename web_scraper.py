@@ -1,24 +1,164 @@
 # web_scraper.py
 
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 
-def scrape_page(url: str) -> str:
+URLS = [
+    "https://tutoring.asu.edu/writing-centers",
+    "https://tutoring.asu.edu/graduate-writing-centers",
+    "https://tutoring.asu.edu/expanded-writing-support",
+    "https://libguides.asu.edu/designresources/citing",
+    "https://libguides.asu.edu/c.php?g=264286&p=1763856",
+    "https://libguides.asu.edu/c.php?g=263905&p=6112359"
+]
+
+CACHE_DIR = "page_cache"
+MAX_WORKERS = 8
+TIMEOUT = 5
+
+
+@dataclass
+class Page:
+    url: str
+    text: str
+    changed: bool     # False for 304s, identical bodies and failed fetches
+    status: int       # HTTP status, or 0 when the request itself failed
+    html: str = ""    # raw body, only set for changed pages fetched with parse=False
+    headers: dict = field(default_factory=dict)
+
+
+def parse_html(html: str) -> str:
+    return BeautifulSoup(html, 'html.parser').get_text()
+
+
+class PageCache:
+    """
+    On-disk page cache.
+
+    <dir>/index.json keeps the ETag / Last-Modified validators and a body hash
+    per URL; <dir>/<key>.html is the raw page and <dir>/<key>.txt its parsed
+    text, so a 304 costs neither a download nor a re-parse.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.dir = directory
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def entry(self, url: str) -> dict:
+        with self._lock:
+            return dict(self.index.get(url, {}))
+
+    def validators(self, url: str) -> dict:
+        e = self.entry(url)
+        headers = {}
+        if e.get("etag"):
+            headers["If-None-Match"] = e["etag"]
+        if e.get("last_modified"):
+            headers["If-Modified-Since"] = e["last_modified"]
+        return headers
+
+    def text(self, url: str) -> str:
+        try:
+            with open(os.path.join(self.dir, self.key(url) + ".txt"), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def store(self, url: str, html: str, text: str, headers) -> None:
+        base = os.path.join(self.dir, self.key(url))
+        for ext, body in ((".html", html), (".txt", text)):
+            tmp = base + ext + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(body)
+            os.replace(tmp, base + ext)
+        with self._lock:
+            self.index[url] = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "sha1": hashlib.sha1(html.encode("utf-8")).hexdigest(),
+            }
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps(self.index, indent=1)
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self._index_path)
+
+
+def make_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_page(session: requests.Session, cache: PageCache, url: str,
+               parse: bool = True) -> Page:
+    """
+    Conditional GET of one page. With parse=False a changed page comes back
+    with `html` and `headers` set and no text; the caller parses it and
+    must then call cache.store() itself.
+    """
     try:
-        response = requests.get(url, timeout=5)
+        response = session.get(url, headers=cache.validators(url), timeout=TIMEOUT)
+        if response.status_code == 304:
+            return Page(url, cache.text(url), False, 304)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        return soup.get_text()
-    except:
-        return ""
+    except Exception:
+        # keep serving the last good copy if we have one
+        return Page(url, cache.text(url), False, 0)
+
+    html = response.text
+    if hashlib.sha1(html.encode("utf-8")).hexdigest() == cache.entry(url).get("sha1"):
+        # server ignored the validators but nothing changed
+        return Page(url, cache.text(url), False, response.status_code)
+    if not parse:
+        return Page(url, "", True, response.status_code, html, response.headers)
+    text = parse_html(html)
+    cache.store(url, html, text, response.headers)
+    return Page(url, text, True, response.status_code)
+
+
+def fetch_all(urls: list[str] = None, cache_dir: str = CACHE_DIR,
+              max_workers: int = MAX_WORKERS) -> list[Page]:
+    """Fetch every URL concurrently with conditional GETs; order follows `urls`."""
+    urls = URLS if urls is None else urls
+    cache = PageCache(cache_dir)
+    with make_session(max_workers) as session, ThreadPoolExecutor(max_workers) as pool:
+        pages = list(pool.map(lambda u: fetch_page(session, cache, u), urls))
+    cache.save()
+    return pages
+
+
+def changed_urls(pages: list[Page]) -> list[str]:
+    return [p.url for p in pages if p.changed]
+
+
+def scrape_page(url: str) -> str:
+    return fetch_all([url])[0].text
+
 
 def get_all_documents() -> list[str]:
-    urls = [
-        "https://tutoring.asu.edu/writing-centers",
-        "https://tutoring.asu.edu/graduate-writing-centers",
-        "https://tutoring.asu.edu/expanded-writing-support",
-        "https://libguides.asu.edu/designresources/citing",
-        "https://libguides.asu.edu/c.php?g=264286&p=1763856",
-        "https://libguides.asu.edu/c.php?g=263905&p=6112359"
-    ]
-    return [scrape_page(url) for url in urls]
+    return [p.text for p in fetch_all()]